@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+End to end benchmark of the fetch pipeline in determine_package_health.py,
+run against a local stand-in for the APIs instead of the real services.
+
+The mock server answers the endpoints the fetchers use:
+    pypi.org/pypi/{package}/json
+    api.github.com/repos/{owner}/{repo}
+    api.github.com/repos/{owner}/{repo}/commits?per_page=1
+    raw.githubusercontent.com/conda-forge/{package}-feedstock/main/README.md
+    api.stackexchange.com/2.3/tags?inname={package}
+    api.stackexchange.com/2.3/tags/{tag1;tag2}/info
+
+with configurable latency, error rate and GitHub rate limit headers.
+Requests are routed to it by mounting a redirecting adapter on the shared
+http client, so the fetchers run unchanged.
+
+A synthetic .py tree or environment.yml importing --modules fake packages
+is scanned with get_script_imports/get_yml_modules, then modules/sec,
+p50/p95 request latency and requests issued per host are reported.
+
+    python benchmark_fetch.py --modules 200 --latency_ms 50 --error_rate 0.02
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+from requests.adapters import HTTPAdapter
+
+import determine_package_health as health
+
+# %%
+
+
+class MockApi(object):
+    """Settings and request counts shared by every mock server thread."""
+
+    def __init__(self, latency_ms: float=20, jitter_ms: float=10, error_rate: float=0,
+                 github_limit: int=5000, github_window: float=3600, seed: int=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.github_limit = github_limit
+        self.github_window = github_window
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}  # host -> count
+        self.errors = 0
+        self.github_used = 0
+        self.github_reset = time.time() + github_window
+
+    def count(self, host: str) -> bool:
+        """Count a request, and roll for an injected error.
+        Input: emulated host
+        Output: True if this request should fail
+        """
+        with self.lock:
+            self.requests[host] = self.requests.get(host, 0) + 1
+            fail = self.random.random() < self.error_rate
+            self.errors += fail
+            delay = max(0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+
+        time.sleep(delay)
+        return fail
+
+    def github_quota(self) -> tuple:
+        """Output: (remaining, reset epoch seconds) after spending one request"""
+        with self.lock:
+            if time.time() >= self.github_reset:
+                self.github_used = 0
+                self.github_reset = time.time() + self.github_window
+            self.github_used += 1
+            return self.github_limit - self.github_used, self.github_reset
+
+
+def package_number(name: str) -> int:
+    """Fake stats derive from the package name, so reruns see the same data.
+    Input: package name
+    Output: stable number for it
+    """
+    return sum(ord(char) * (i + 1) for i, char in enumerate(name))
+
+
+def pypi_payload(package: str) -> dict:
+    number = package_number(package)
+    return {"info": {"name": package,
+                     "summary": f"Benchmark package {package}",
+                     "requires_python": ">=3.7",
+                     "requires_dist": [f"dep{number % 7}>=1.0"],
+                     "yanked": False,
+                     "project_urls": {"Homepage": f"https://github.com/{package}/{package}"},
+                     },
+            "vulnerabilities": [],
+            }
+
+
+def github_repo_payload(owner: str, repo: str) -> dict:
+    number = package_number(repo)
+    return {"full_name": f"{owner}/{repo}",
+            "description": f"Benchmark repo {repo}",
+            "created_at": "2018-01-01T00:00:00Z",
+            "updated_at": "2022-10-01T00:00:00Z",
+            "subscribers_count": number % 100,
+            "stargazers_count": number % 5000,
+            "has_issues": True,
+            "open_issues_count": number % 50,
+            "open_issues": number % 50,
+            "has_projects": True,
+            "has_downloads": True,
+            "has_wiki": False,
+            "allow_forking": True,
+            "fork": False,
+            "forks_count": number % 300,
+            "forks": number % 300,
+            }
+
+
+def readme_payload(package: str) -> str:
+    return (f"About {package}-feedstock\n"
+            f"=====================\n\n"
+            f"Home: https://github.com/{package}/{package}\n\n"
+            f"Development: https://github.com/{package}/{package}\n")
+
+
+def stackoverflow_tag(name: str) -> dict:
+    return {"name": name, "has_synonyms": False, "count": package_number(name) % 10000}
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    """Serves http://127.0.0.1:{port}/{host}/{path} as if it were
+    https://{host}/{path}. The MockApi instance is set on the server.
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real hosts
+
+    def log_message(self, format, *args):
+        pass  # too noisy at thousands of requests
+
+    def send_json(self, status: int, payload, headers: dict=None):
+        body = payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json" if not isinstance(payload, str) else "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        host = self.path.lstrip("/").split("/")[0]
+        self.server.api.count(host)
+        # graphql isn't emulated, errors send the fetchers back to REST
+        self.send_json(200, {"errors": [{"message": "graphql not emulated"}]})
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        host, _, path = parsed.path.lstrip("/").partition("/")
+        query = parse_qs(parsed.query)
+        parts = [unquote(part) for part in path.split("/")]
+        api = self.server.api
+
+        if api.count(host):
+            self.send_json(503, {"message": "injected error"})
+            return
+
+        if host == "pypi.org" and len(parts) == 3 and parts[0] == "pypi":
+            self.send_json(200, pypi_payload(parts[1]))
+
+        elif host == "api.github.com" and parts[0] == "repos":
+            remaining, reset = api.github_quota()
+            headers = {"X-RateLimit-Limit": str(api.github_limit),
+                       "X-RateLimit-Remaining": str(max(remaining, 0)),
+                       "X-RateLimit-Reset": str(int(reset))}
+            if remaining < 0:
+                self.send_json(403, {"message": "API rate limit exceeded"}, headers)
+            elif len(parts) == 3:
+                self.send_json(200, github_repo_payload(parts[1], parts[2]), headers)
+            elif len(parts) == 4 and parts[3] == "commits":
+                commits = package_number(parts[2]) % 2000 + 1
+                if "since" in query:
+                    commits = commits // 10
+                last_url = f"https://api.github.com/repos/{parts[1]}/{parts[2]}/commits?per_page=1&page={commits}"
+                headers["Link"] = f'<{last_url}>; rel="last"'
+                self.send_json(200, [{"sha": "0" * 40}], headers)
+            else:
+                self.send_json(404, {"message": "Not Found"}, headers)
+
+        elif host == "raw.githubusercontent.com" and len(parts) >= 2 and parts[1].endswith("-feedstock"):
+            self.send_json(200, readme_payload(parts[1][:-len("-feedstock")]))
+
+        elif host == "api.stackexchange.com" and parts[:2] == ["2.3", "tags"]:
+            if len(parts) == 2:  # fuzzy search
+                names = query.get("inname", [""])
+            else:  # exact names, tag1;tag2/info
+                names = parts[2].split(";")
+            self.send_json(200, {"items": [stackoverflow_tag(name) for name in names],
+                                 "quota_max": 10000,
+                                 "quota_remaining": 9999})
+
+        else:
+            self.send_json(404, {"message": "Not Found"})
+
+
+def start_mock_server(api: MockApi) -> ThreadingHTTPServer:
+    """Input: shared MockApi settings
+    Output: running server, on a free local port
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockApiHandler)
+    server.daemon_threads = True
+    server.api = api
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+# %%
+
+
+class RedirectAdapter(HTTPAdapter):
+    """Sends https://{host}/{path} to the mock server instead, timing each
+    request on the way.
+    """
+
+    def __init__(self, base_url: str, latencies: list, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.latencies = latencies
+
+    def send(self, request, **kwargs):
+        parsed = urlparse(request.url)
+        request.url = f"{self.base_url}/{parsed.netloc}{parsed.path}"
+        if parsed.query:
+            request.url += f"?{parsed.query}"
+
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+
+        return response
+
+
+def install_mock_client(base_url: str, latencies: list):
+    """Pre-builds the shared http client with every api host redirected.
+    Input: mock server url, list collecting request latencies
+    """
+    sess = health.requests.Session()
+    for host in health.api_hosts:
+        adapter = RedirectAdapter(base_url, latencies, pool_connections=1, pool_maxsize=health.http_pool_size)
+        sess.mount(f"https://{host}/", adapter)
+    health.http_client = sess
+
+
+# %%
+
+
+def write_corpus(dir_root: str, source: str, modules: int, files: int):
+    """Writes a scan input importing `modules` fake third party packages.
+    Input: directory, scripts or yaml, module count, .py file count
+    """
+    names = [f"benchpkg{i}" for i in range(modules)]
+    if source == "scripts":
+        for i in range(files):
+            with open(os.path.join(dir_root, f"bench_{i}.py"), "w") as file:
+                for name in names[i::files]:
+                    file.write(f"import {name}\n")
+    else:
+        conda = [f"{name}=1.0" for name in names[::2]]
+        pip = [f"{name}==1.0" for name in names[1::2]]
+        with open(os.path.join(dir_root, "environment.yml"), "w") as file:
+            file.write(health.yaml.safe_dump({"name": "bench",
+                                              "dependencies": conda + [{"pip": pip}]}))
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Input: values, fraction e.g. 0.95
+    Output: nearest rank percentile, 0 for no values
+    """
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_benchmark(opts) -> dict:
+    """Scan a synthetic corpus against the mock server.
+    Input: parsed CLI options
+    Output: dict of benchmark results
+    """
+    api = MockApi(opts.latency_ms, opts.jitter_ms, opts.error_rate, opts.github_limit, opts.github_window, opts.seed)
+    server = start_mock_server(api)
+    latencies = []
+
+    dir_work = tempfile.mkdtemp(prefix="lib_scan_bench_")
+    dir_input = os.path.join(dir_work, "input")
+    os.makedirs(dir_input)
+    os.makedirs(os.path.join(dir_work, "output"))
+    write_corpus(dir_input, opts.source, opts.modules, opts.files)
+
+    # point the pipeline at the corpus, with outputs kept out of ./output
+    health.dir_py = dir_work
+    health.input_py_dirs = [dir_input]
+    health.input_yml_dirs = [dir_input]
+    health.max_workers = opts.workers
+    health.max_per_host = opts.per_host
+    health.stackoverflow_lookup = opts.stackoverflow_lookup
+    health.response_cache = None
+    health.scan_index = None
+    install_mock_client(f"http://127.0.0.1:{server.server_address[1]}", latencies)
+
+    started = time.perf_counter()
+    if opts.source == "scripts":
+        all_modules = health.get_script_imports(dir_work)
+    else:
+        all_modules = health.get_yml_modules()
+    elapsed = time.perf_counter() - started
+
+    server.shutdown()
+    if not opts.keep_output:
+        shutil.rmtree(dir_work)
+
+    fetched = sum(len(modules) for modules in all_modules.values())
+    results = {"source": opts.source,
+               "modules": fetched,
+               "seconds": round(elapsed, 3),
+               "modules_per_sec": round(fetched / elapsed, 2) if elapsed else None,
+               "requests": sum(api.requests.values()),
+               "requests_per_host": api.requests,
+               "injected_errors": api.errors,
+               "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+               "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+               "latency_max_ms": round(max(latencies, default=0) * 1000, 2),
+               "url_memo_hits": health.run_memo.hits,
+               "settings": {"workers": opts.workers,
+                            "per_host": opts.per_host,
+                            "latency_ms": opts.latency_ms,
+                            "error_rate": opts.error_rate,
+                            "github_limit": opts.github_limit,
+                            "stackoverflow_lookup": opts.stackoverflow_lookup},
+               }
+    if opts.keep_output:
+        results["output_dir"] = dir_work
+
+    return results
+
+
+# %%
+
+parser = argparse.ArgumentParser(prog="benchmark_fetch",
+                                 description='Benchmarks the fetch pipeline against a local mock of the pypi, github and stackexchange APIs')
+
+parser.add_argument('-s', '--source',
+                    help="Scan a synthetic .py tree (`scripts`) or environment.yml (`yaml`)",
+                    choices=['scripts', 'yaml'],
+                    default='scripts')
+
+parser.add_argument('--modules',
+                    help="Number of fake third party packages imported",
+                    type=int,
+                    default=100)
+
+parser.add_argument('--files',
+                    help="Number of .py files the imports are spread over, for `scripts`",
+                    type=int,
+                    default=20)
+
+parser.add_argument('--latency_ms',
+                    help="Mean mock server response delay",
+                    type=float,
+                    default=20)
+
+parser.add_argument('--jitter_ms',
+                    help="Standard deviation of the response delay",
+                    type=float,
+                    default=10)
+
+parser.add_argument('--error_rate',
+                    help="Fraction of requests answered with a 503",
+                    type=float,
+                    default=0)
+
+parser.add_argument('--github_limit',
+                    help="GitHub requests allowed per rate limit window, sent as X-RateLimit-* headers",
+                    type=int,
+                    default=5000)
+
+parser.add_argument('--github_window',
+                    help="Seconds until the GitHub rate limit window resets",
+                    type=float,
+                    default=3600)
+
+parser.add_argument('-w', '--workers',
+                    help="Max number of API lookups in flight at once, across all hosts",
+                    type=int,
+                    default=16)
+
+parser.add_argument('--per_host',
+                    help="Max number of API lookups in flight at once against any single host",
+                    type=int,
+                    default=4)
+
+parser.add_argument('--stackoverflow_lookup',
+                    choices=['batch', 'search'],
+                    default='batch')
+
+parser.add_argument('--seed',
+                    help="Seed for injected latency and errors",
+                    type=int,
+                    default=0)
+
+parser.add_argument('--keep_output',
+                    help="Keep the temporary corpus and outputs, printing where they are",
+                    action='store_true')
+
+parser.add_argument('--json_out',
+                    help="Also write results to this .json file",
+                    default=None)
+
+
+if __name__ == "__main__":
+    opts = parser.parse_args()
+    results = run_benchmark(opts)
+
+    print(json.dumps(results, indent=4))
+    if opts.json_out:
+        with open(opts.json_out, "w") as outfile:
+            outfile.write(json.dumps(results, indent=4))
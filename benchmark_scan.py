@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Scan phase micro-benchmarks for determine_package_health.py, run on a
+reproducible synthetic project tree instead of real code.
+
+The generator writes nested packages of .py files with a configurable mix of
+standard library, local and third party imports, in the forms seen in real
+code (import x, import x.y as z, from x.y import z, relative imports), plus
+conda environment.yml files with conda and pip sections.
+
+Each stage is timed separately, --repeat times:
+    walk              walk_files over the tree
+    extract_serial    extract_imports file by file
+    extract_many      extract_imports_many, in processes on large trees
+    extract_indexed   extract_imports_indexed, cold then warm scan index
+    classify          ModuleIndex build plus classify of every import
+    yaml              read_yml_env over every environment file
+
+Results are printed as json, so runs can be diffed over time.
+
+    python benchmark_scan.py --files 5000 --json_out output/bench_scan.json
+    python benchmark_scan.py --generate_only ./corpus
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import determine_package_health as health
+
+# %%
+
+
+def stdlib_pool() -> list:
+    """Output: public top-level stdlib names of the running interpreter"""
+    names = getattr(sys, "stdlib_module_names", None) or health.get_stdlib_names()
+    return sorted(name for name in names if not name.startswith("_"))
+
+
+def import_line(rng: random.Random, name: str) -> str:
+    """Input: random generator, top-level module name
+    Output: one import statement of a randomly chosen form
+    """
+    form = rng.randrange(4)
+    if form == 0:
+        return f"import {name}\n"
+    if form == 1:
+        return f"import {name}.core as {name}_core\n"
+    if form == 2:
+        return f"from {name}.utils import helper, Thing\n"
+    return f"from {name} import (\n    alpha,\n    beta,\n)\n"
+
+
+def generate_corpus(dir_root: str, files: int=1000, imports_per_file: int=15,
+                    mix: tuple=(0.5, 0.2, 0.3), third_party: int=300, depth: int=3,
+                    env_files: int=10, deps_per_env: int=40, seed: int=0) -> dict:
+    """Writes a synthetic project tree.
+    Input: directory, .py file count, imports per file,
+        (stdlib, local, third party) import fractions, third party pool size,
+        package nesting depth, environment.yml count, dependencies per env
+        file, random seed
+    Output: dict describing the corpus
+    """
+    rng = random.Random(seed)
+    stdlib = stdlib_pool()
+    third = [f"thirdpkg{i}" for i in range(third_party)]
+    local = [f"localmod{i}" for i in range(files)]
+
+    body = "".join(f"\n\ndef function_{i}(value):\n    return value * {i}\n" for i in range(10))
+    for i, name in enumerate(local):
+        parts = [f"pkg{rng.randrange(4)}" for level in range(rng.randrange(depth + 1))]
+        dirpath = os.path.join(dir_root, "src", *parts)
+        os.makedirs(dirpath, exist_ok=True)
+
+        lines = ['"""Synthetic module."""\n']
+        for n in range(imports_per_file):
+            kind = rng.choices(["stdlib", "local", "third"], weights=mix)[0]
+            if kind == "stdlib":
+                lines.append(import_line(rng, rng.choice(stdlib)))
+            elif kind == "local":
+                lines.append(f"import {rng.choice(local)}\n" if rng.random() < 0.8 else "from . import sibling\n")
+            else:
+                lines.append(import_line(rng, rng.choice(third)))
+
+        with open(os.path.join(dirpath, f"{name}.py"), "w") as file:
+            file.write("".join(lines) + body)
+
+    for i in range(env_files):
+        dirpath = os.path.join(dir_root, "envs", f"env{i}")
+        os.makedirs(dirpath, exist_ok=True)
+        conda = [f"{name}={rng.randrange(1, 5)}.{rng.randrange(10)}" for name in rng.sample(third, min(deps_per_env, third_party))]
+        pip = [f"{name}=={rng.randrange(1, 5)}.0" for name in rng.sample(third, min(deps_per_env // 4, third_party))]
+        env = {"name": f"env{i}",
+               "channels": ["conda-forge", "defaults"],
+               "dependencies": conda + ["pip", {"pip": pip}]}
+        with open(os.path.join(dirpath, "environment.yml"), "w") as file:
+            file.write(health.yaml.safe_dump(env, sort_keys=False))
+
+    return {"files": files,
+            "imports_per_file": imports_per_file,
+            "mix_stdlib_local_third": list(mix),
+            "third_party_pool": third_party,
+            "depth": depth,
+            "env_files": env_files,
+            "deps_per_env": deps_per_env,
+            "seed": seed,
+            }
+
+
+# %%
+
+
+def time_stage(run, repeat: int) -> dict:
+    """Input: zero argument function returning an item count, repeat count
+    Output: dict of timings, with rates from the fastest run
+    """
+    seconds = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        items = run()
+        seconds.append(time.perf_counter() - started)
+
+    fastest = min(seconds)
+    return {"items": items,
+            "seconds_min": round(fastest, 4),
+            "seconds_median": round(statistics.median(seconds), 4),
+            "items_per_sec": round(items / fastest, 1) if fastest else None,
+            }
+
+
+def run_benchmarks(dir_root: str, repeat: int) -> dict:
+    """Times each scan stage on a generated corpus.
+    Input: corpus directory, repeat count
+    Output: dict of stage name -> timings
+    """
+    dir_src = os.path.join(dir_root, "src")
+    filepaths = list(health.walk_files(dir_src, ('.py',)))
+    env_paths = list(health.walk_files(os.path.join(dir_root, "envs"), ('.yml', '.yaml')))
+    file_imports = health.extract_imports_many(filepaths)
+
+    stages = {}
+    stages["walk"] = time_stage(lambda: len(list(health.walk_files(dir_src, ('.py',)))), repeat)
+    stages["extract_serial"] = time_stage(lambda: len([health.extract_imports(path) for path in filepaths]), repeat)
+    stages["extract_many"] = time_stage(lambda: len(health.extract_imports_many(filepaths)), repeat)
+
+    dir_index = tempfile.mkdtemp(prefix="lib_scan_index_")
+    try:
+        health.scan_index = health.ScanIndex(dir_index)
+        stages["extract_indexed_cold"] = time_stage(lambda: len(health.extract_imports_indexed(filepaths, rescan=True)), repeat)
+        stages["extract_indexed_warm"] = time_stage(lambda: len(health.extract_imports_indexed(filepaths)), repeat)
+        health.scan_index.conn.close()
+    finally:
+        health.scan_index = None
+        shutil.rmtree(dir_index)
+
+    def classify() -> int:
+        module_index = health.ModuleIndex()
+        module_index.set_local(dir_src, filepaths)
+        return len([module_index.classify(module) for modules in file_imports.values() for module in modules])
+
+    stages["classify"] = time_stage(classify, repeat)
+    stages["yaml"] = time_stage(lambda: len([health.read_yml_env(path) for path in env_paths]), repeat)
+
+    return stages
+
+
+# %%
+
+parser = argparse.ArgumentParser(prog="benchmark_scan",
+                                 description='Generates a synthetic project tree and times each stage of the import scan')
+
+parser.add_argument('--files',
+                    help="Number of .py files",
+                    type=int,
+                    default=1000)
+
+parser.add_argument('--imports_per_file',
+                    type=int,
+                    default=15)
+
+parser.add_argument('--mix',
+                    help="Fractions of stdlib, local and third party imports, e.g. 0.5,0.2,0.3",
+                    type=lambda mix: tuple(float(part) for part in mix.split(',')),
+                    default=(0.5, 0.2, 0.3))
+
+parser.add_argument('--third_party',
+                    help="Number of distinct third party packages imported",
+                    type=int,
+                    default=300)
+
+parser.add_argument('--depth',
+                    help="Max package nesting depth",
+                    type=int,
+                    default=3)
+
+parser.add_argument('--env_files',
+                    help="Number of environment.yml files",
+                    type=int,
+                    default=10)
+
+parser.add_argument('--deps_per_env',
+                    help="Conda dependencies per environment.yml, plus a quarter as many pip ones",
+                    type=int,
+                    default=40)
+
+parser.add_argument('--seed',
+                    type=int,
+                    default=0)
+
+parser.add_argument('--repeat',
+                    help="Runs per stage, the fastest is reported",
+                    type=int,
+                    default=3)
+
+parser.add_argument('--generate_only',
+                    help="Write the corpus to this directory and exit, without benchmarking",
+                    metavar='DIR',
+                    default=None)
+
+parser.add_argument('--json_out',
+                    help="Also write results to this .json file",
+                    default=None)
+
+
+if __name__ == "__main__":
+    opts = parser.parse_args()
+    corpus_args = (opts.files, opts.imports_per_file, opts.mix, opts.third_party,
+                   opts.depth, opts.env_files, opts.deps_per_env, opts.seed)
+
+    if opts.generate_only:
+        print(json.dumps(generate_corpus(opts.generate_only, *corpus_args), indent=4))
+        sys.exit()
+
+    dir_root = tempfile.mkdtemp(prefix="lib_scan_corpus_")
+    try:
+        corpus = generate_corpus(dir_root, *corpus_args)
+        results = {"python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "cpus": os.cpu_count(),
+                   "corpus": corpus,
+                   "stages": run_benchmarks(dir_root, opts.repeat),
+                   }
+    finally:
+        shutil.rmtree(dir_root)
+
+    print(json.dumps(results, indent=4))
+    if opts.json_out:
+        with open(opts.json_out, "w") as outfile:
+            outfile.write(json.dumps(results, indent=4))
@@ -65,13 +65,25 @@ then oop refactor:
 import platform
 import requests
 import os
-import subprocess
 import io
 import sys
 import json
-from datetime import datetime  # for delta days
+from datetime import datetime, timedelta, timezone  # for delta days
 import yaml
 import argparse
+import ast
+import tokenize
+import hashlib
+import fnmatch
+import re
+import importlib.metadata
+import threading
+import sqlite3
+import time
+from urllib.parse import urlparse, quote, parse_qs
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, Future
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
 
 # to timestamp file
 right_now = datetime.today().strftime('%Y%m%d_%H%M%S')
@@ -98,45 +110,899 @@ parser = argparse.ArgumentParser(prog=module_name,
                                  epilog='Please suggest any improvements.')
 
 parser.add_argument('-c', '--creds_in_txt',
-                    help="Use this option if your creds are saved in ./creds.txt, not ~./env")
+                    help="Use this option if your creds are saved in ./creds.txt, in addition to ~/.env and environment variables")
 
 parser.add_argument('-s', '--source',  # the option
-                    help="If you want to generate output from python scripts, input `scripts`. Otherwise, if yaml/yml, input `yaml`",
-                    choices=['scripts', 'yaml'],
+                    help="If you want to generate output from python scripts, input `scripts`. Otherwise, if yaml/yml, input `yaml`. "
+                         "`all` scans both into one registry, looking each package up once",
+                    choices=['scripts', 'yaml', 'all'],
                     default='scripts')  # if no option, default on addition
 
+parser.add_argument('--input_py',
+                    help="Project roots to scan recursively for .py files. Defaults to ./input_py",
+                    nargs='+',
+                    default=[os.path.join(dir_py, "input_py")])
+
+parser.add_argument('--input_yml',
+                    help="Directories to scan recursively for conda environment .yml/.yaml files. Defaults to ./input_yml",
+                    nargs='+',
+                    default=[os.path.join(dir_py, "input_yml")])
+
+parser.add_argument('--github_api',
+                    help="GitHub backend for repo stats. `graphql` batches many repos per query (needs a token), falling back to `rest`",
+                    choices=['rest', 'graphql'],
+                    default='rest')
+
+parser.add_argument('--stackoverflow_lookup',
+                    help="`batch` looks up 100 exact tag names per request, searching only for misses. `search` runs one fuzzy search per module",
+                    choices=['batch', 'search'],
+                    default='batch')
+
+parser.add_argument('-w', '--workers',
+                    help="Max number of API lookups in flight at once, across all hosts",
+                    type=int,
+                    default=16)
+
+parser.add_argument('--per_host',
+                    help="Max number of API lookups in flight at once against any single host",
+                    type=int,
+                    default=4)
+
+parser.add_argument('--pool_size',
+                    help="Keep-alive connections held open per API host",
+                    type=int,
+                    default=10)
+
+parser.add_argument('--timeout',
+                    help="Seconds to wait on an API host to connect or send data",
+                    type=float,
+                    default=30)
+
+parser.add_argument('--max_rate_wait',
+                    help="Longest a request may wait for a spent API rate limit to reset, in seconds. Longer waits skip the request",
+                    type=float,
+                    default=15 * 60)
+
+parser.add_argument('--cache_dir',
+                    help="Directory for the on-disk API response cache and .py scan index",
+                    default=os.path.join(dir_py, "cache"))
+
+parser.add_argument('--no_cache',
+                    help="Always query APIs and parse every .py file, ignoring and not writing the caches",
+                    action='store_true')
+
+parser.add_argument('--max_cache_mb',
+                    help="Size limit for the response cache. Least recently used responses are evicted first",
+                    type=float,
+                    default=500)
+
+parser.add_argument('--parse_processes',
+                    help="Processes used to parse .py files for imports on large trees. Defaults to one per cpu",
+                    type=int,
+                    default=None)
+
+parser.add_argument('--target_python',
+                    help="Python version the scanned scripts run on, e.g. 3.8, used to tell standard library imports apart. Defaults to this interpreter's version",
+                    type=lambda version: tuple(int(part) for part in version.split('.')[:2]),
+                    default=None)
+
+parser.add_argument('--output',
+                    help="`json` writes one file at the end of a run. `ndjson` appends each module as soon as its lookups finish",
+                    choices=['json', 'ndjson'],
+                    default='json')
+
+parser.add_argument('--fold',
+                    help="Fold an .ndjson output file back into the nested .json format, then exit",
+                    metavar='NDJSON_FILE',
+                    default=None)
+
+parser.add_argument('--export',
+                    help="Also write results as typed tables, one row per module: .sqlite, and .parquet if pyarrow is installed",
+                    action='store_true')
+
+parser.add_argument('--export_from',
+                    help="Export an existing .json or .ndjson output file to .sqlite/.parquet tables, then exit",
+                    metavar='OUTPUT_FILE',
+                    default=None)
+
+parser.add_argument('--conda_channel_data',
+                    help="Downloaded conda-forge channeldata.json and/or repodata.json, optionally .bz2/.zst compressed. Conda lookups then read a local index instead of probing feedstocks on github. Repeatable",
+                    action='append',
+                    default=[])
+
+parser.add_argument('--prefix',
+                    help="Environment the scanned scripts run in, e.g. ~/miniconda3/envs/project, whose installed distributions imports are resolved to. Defaults to this interpreter's",
+                    default=None)
+
+parser.add_argument('--import_names',
+                    help="Extra json file mapping import names to distribution names, e.g. {\"sklearn\": \"scikit-learn\"}, over the bundled ./import_names.json. Repeatable",
+                    action='append',
+                    default=[])
+
+parser.add_argument('--skip_unresolved',
+                    help="Only report imports which match no installed or listed distribution, instead of looking them up under their import name",
+                    action='store_true')
+
+parser.add_argument('--resume',
+                    help="Continue an interrupted scan from its checkpoint in ./output, retrying only failed or missing lookups",
+                    action='store_true')
+
+parser.add_argument('--transitive_depth',
+                    help="Also look up what pip packages pull in, from pypi requires_dist, this many levels deep. Defaults to 0, off",
+                    type=int,
+                    default=0)
+
+parser.add_argument('--rescan',
+                    help="Re-parse every .py file, ignoring imports stored in the scan index",
+                    action='store_true')
+
 # %%
 
 
-def token_in_env(token_env: bool=False) -> str:
-    """If you have Github token saved in ~/.env, input True.
-    Otherwise, input your Github user and pass into ./creds.txt,
-    on line 1 and line 2, per the provided format.
+class CredentialProvider(object):
+    """GitHub tokens, read once at startup instead of on every request.
+
+    Tokens come from the environment, ~/.env (needs python-dotenv) and,
+    with --creds_in_txt, ./creds.txt. Variables github_token or
+    github_tokens may hold several comma separated tokens. creds.txt holds
+    the user on line 1 and one token per line after it.
+
+    Each token gets its own rate limit budget per GitHub API, and every
+    request goes out on the token with the most budget left, so a pool of
+    tokens multiplies the hourly limit.
     """
-    if token_env:
 
-        from dotenv import load_dotenv  # pip install python-dotenv
+    placeholders = {"", "github_token"}  # unfilled creds.txt template
 
-        # set environmental variables
-        home = Path.home() / ".env"
-        load_dotenv(home)
-        github_user = os.getenv("github_user")
-        github_token = os.getenv("github_token")
+    def __init__(self):
+        self.user = None
+        self.tokens = []
+        self.lock = threading.Lock()
+        self.limiters = {}  # (token, api) -> RateLimiter
+        self.turn = 0  # rotates ties, so unknown budgets share the load
 
-    else:
+    def add_tokens(self, value: str):
+        """Input: one token, or several separated by commas"""
+        for token in (value or "").split(","):
+            token = token.strip()
+            if token not in self.placeholders and token not in self.tokens:
+                self.tokens.append(token)
+
+    def load(self, creds_in_txt: bool=False):
+        """Read tokens from every configured source."""
         try:
-            # read github tokens from script dir, creds.txt
-            current_path = os.path.realpath(os.getcwd())
-            filename = "creds.txt"
-            full_path = f"{current_path}\\{filename}"
-            # read lines and extract as variables
-            lines = open(full_path, "r").readlines()
-            github_user, github_token = lines[0].strip(), lines[1].strip()
-        
-        except:
-            print("Error related to reading Github creds from ./creds.txt")
+            from dotenv import dotenv_values  # pip install python-dotenv
+            env_file = dotenv_values(Path.home() / ".env")
+        except ImportError:
+            env_file = {}
+
+        for source in (os.environ, env_file):
+            self.user = self.user or source.get("github_user")
+            self.add_tokens(source.get("github_token"))
+            self.add_tokens(source.get("github_tokens"))
+
+        if creds_in_txt:
+            try:
+                with open(os.path.join(dir_py, "creds.txt"), "r") as file:
+                    lines = [line.strip() for line in file.readlines()]
+                self.user = self.user or lines[0]
+                for line in lines[1:]:
+                    self.add_tokens(line)
+
+            except (OSError, IndexError):
+                print("Error related to reading Github creds from ./creds.txt")
+
+        print(f"github tokens loaded: {len(self.tokens)}")
+
+    def pick(self, api: str) -> tuple:
+        """Choose the token with the most budget left for an api.
+        Input: rate limit name, e.g. api.github.com
+        Output: (token, its RateLimiter), or (None, None) with no tokens
+        """
+        if not self.tokens:
+            return None, None
+
+        def budget(token):
+            limiter = self.limiters[(token, api)]
+            if limiter.remaining is None or (limiter.reset_at or 0) < time.time():
+                return float("inf")  # unknown or already reset
+            return limiter.remaining
+
+        with self.lock:
+            for token in self.tokens:
+                if (token, api) not in self.limiters:
+                    self.limiters[(token, api)] = RateLimiter(f"{api} token ...{token[-4:]}")
+
+            self.turn += 1
+            start = self.turn % len(self.tokens)
+            order = self.tokens[start:] + self.tokens[:start]
+            token = max(order, key=budget)  # first of equals wins
+
+            return token, self.limiters[(token, api)]
+
+
+github_credentials = CredentialProvider()
+
+
+# %%
+
+# concurrency limits, overwritten by CLI options at startup
+max_workers = 16  # lookups in flight across all hosts
+max_per_host = 4  # lookups in flight against any one host
+
+host_semaphores = {}
+host_semaphores_lock = threading.Lock()
+
+
+def get_host_semaphore(query_url: str) -> threading.BoundedSemaphore:
+    """Each API host (pypi.org, api.github.com, ...) gets its own semaphore,
+    created on first use, so one slow host can't hog every worker.
+    Input: request url
+    Output: semaphore shared by all requests to that host
+    """
+    host = urlparse(query_url).netloc
+    with host_semaphores_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.BoundedSemaphore(max_per_host)
+
+        return host_semaphores[host]
+
+
+# shared http client settings, overwritten by CLI options at startup
+http_pool_size = 10  # keep-alive connections per host
+http_timeout = 30  # seconds
+api_hosts = ["pypi.org",
+             "api.github.com",
+             "raw.githubusercontent.com",
+             "api.stackexchange.com",
+             ]
+
+http_client = None
+http_client_lock = threading.Lock()
+
+
+def get_http_client() -> requests.Session:
+    """Process-wide session shared by every fetcher, built on first use.
+    Each API host gets its own keep-alive connection pool, so repeat requests
+    reuse an open connection instead of paying a new TCP+TLS handshake.
+    Output: shared session
+    """
+    global http_client
+    with http_client_lock:
+        if http_client is None:
+            sess = requests.Session()
+            for host in api_hosts:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=http_pool_size)
+                sess.mount(f"https://{host}/", adapter)
+            http_client = sess
+
+        return http_client
+
+
+# longest a request will wait on a spent rate limit, overwritten by CLI option
+max_rate_wait = 15 * 60  # seconds
+
+
+class RateLimiter(object):
+    """Request budget for one rate-limited API, learned from its responses:
+    X-RateLimit-Limit/Remaining/Reset headers on GitHub, quota_max/
+    quota_remaining/backoff fields in Stack Exchange bodies.
+
+    While plenty of budget is left, requests go out freely. Once remaining
+    drops under reserve_fraction of the limit, only high priority requests
+    are sent, spaced evenly so the remainder lasts until the reset. Backoff
+    and Retry-After delays are honored. A request which would have to wait
+    more than max_rate_wait is skipped instead.
+    """
+
+    reserve_fraction = 0.1
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None  # epoch seconds
+        self.next_request_at = 0.0  # epoch seconds, from pacing or backoff
+
+    def acquire(self, priority: int) -> bool:
+        """Block until this request may be sent.
+        Input: request priority, see request_priority
+        Output: False if the request should be skipped
+        """
+        with self.lock:
+            now = time.time()
+            send_at = max(now, self.next_request_at)
+            interval = 0
+
+            if self.remaining is not None and self.reset_at is not None and self.reset_at > now:
+                reserve = (self.limit or 0) * self.reserve_fraction
+                if self.remaining <= 0:  # spent, wait for the reset
+                    send_at = max(send_at, self.reset_at)
+                elif self.remaining <= reserve:
+                    if priority < high_priority:
+                        return False
+                    interval = (self.reset_at - now) / self.remaining
+
+            if send_at - now > max_rate_wait:
+                return False
+
+            self.next_request_at = send_at + interval
+            if self.remaining is not None and self.remaining > 0:
+                self.remaining -= 1  # until the response says otherwise
+
+        if send_at > now:
+            time.sleep(send_at - now)
+
+        return True
+
+    def update(self, response: requests.Response):
+        """Read the latest budget from a response."""
+        headers = response.headers
+        now = time.time()
+        with self.lock:
+            if "X-RateLimit-Remaining" in headers:  # github
+                self.limit = int(headers.get("X-RateLimit-Limit", 0)) or self.limit
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+                self.reset_at = float(headers.get("X-RateLimit-Reset", now))
+
+            if "Retry-After" in headers and headers["Retry-After"].isdigit():  # github secondary limit
+                self.next_request_at = max(self.next_request_at, now + int(headers["Retry-After"]))
+
+        if "stackexchange" not in self.name:
+            return
+
+        try:
+            data = response.json()
+        except ValueError:
+            return
+
+        with self.lock:
+            if "quota_remaining" in data:
+                self.limit = data.get("quota_max", self.limit)
+                self.remaining = data["quota_remaining"]
+                # stack exchange quotas reset at midnight utc
+                self.reset_at = (now // 86400 + 1) * 86400
+
+            if "backoff" in data:
+                self.next_request_at = max(self.next_request_at, now + data["backoff"])
+
+
+# priorities, low is skipped first when a budget runs short
+low_priority = 0
+high_priority = 1
+
+rate_limiters = {"api.github.com": RateLimiter("api.github.com"),
+                 "api.github.com/graphql": RateLimiter("api.github.com/graphql"),  # separate budget
+                 "api.stackexchange.com": RateLimiter("api.stackexchange.com"),
+                 }
+
+
+def get_rate_limiter(query_url: str) -> tuple:
+    """GitHub requests are spread over the credential pool, each token with
+    its own budget. Without tokens, requests share one anonymous budget.
+    Input: request url
+    Output: (github token or None, RateLimiter or None if not rate limited)
+    """
+    parsed = urlparse(query_url)
+    api = parsed.netloc
+    if parsed.path.startswith("/graphql"):
+        api = parsed.netloc + "/graphql"
+
+    if api.startswith("api.github.com"):
+        token, limiter = github_credentials.pick(api)
+        if token is not None:
+            return token, limiter
+
+    return None, rate_limiters.get(api)
+
+
+def request_priority(query_url: str) -> int:
+    """Conda-forge feedstock probes and commit counts are extras, and are the
+    first requests dropped when a budget runs short. Repo stats and tag
+    lookups are kept.
+    Input: request url
+    Output: low_priority or high_priority
+    """
+    if "/repos/conda-forge/" in query_url or urlparse(query_url).path.endswith("/commits"):
+        return low_priority
+
+    return high_priority
+
+
+def limited_request(sess: requests.Session, method: str, query_url: str, **kwargs) -> requests.Response:
+    """Request which waits for its API's rate limit budget, then a free slot
+    on the target host. The body is read before the slot is released, so the
+    slot covers the whole download, not just the headers. If the budget
+    can't cover the request, a 429 response is returned without sending it.
+    Input: session, http method, request url, any requests kwargs
+    Output: response
+    """
+    token, limiter = get_rate_limiter(query_url)
+    if limiter is not None and not limiter.acquire(request_priority(query_url)):
+        print(f"rate limit budget low for {limiter.name}, skipping {query_url}")
+        return build_response(query_url, 429, {}, b"")
+
+    if token is not None:
+        kwargs["headers"] = {**(kwargs.get("headers") or {}), "Authorization": f"bearer {token}"}
+
+    kwargs.setdefault("timeout", http_timeout)
+    body_filter = get_body_filter(query_url) if method == "GET" else None
+    with get_host_semaphore(query_url):
+        if body_filter is None:
+            response = sess.request(method, query_url, **kwargs)
+            response.content  # read body while slot is held
+        else:
+            response = sess.request(method, query_url, stream=True, **kwargs)
+            filter_body(response, body_filter)
+
+    if limiter is not None:
+        limiter.update(response)
+
+    return response
+
+
+def filter_body(response: requests.Response, body_filter):
+    """Read a streamed 200 response through a body filter, keeping only what
+    the filter returns. Other responses are read as is.
+    Input: response requested with stream=True, body filter
+    """
+    if response.status_code != 200:
+        response.content
+        return
+
+    response.raw.decode_content = True  # undo gzip while streaming
+    try:
+        body = body_filter(response.raw)
+    except Exception as error:  # truncated or malformed json
+        print(f"could not read {response.url}: {error}")
+        response.status_code = 502
+        body = b""
+    finally:
+        response.close()
+
+    response._content = body
+    response._content_consumed = True
+    response.headers.pop("Content-Encoding", None)
+    response.headers["Content-Length"] = str(len(body))
+
+
+def limited_get(sess: requests.Session, query_url: str, **kwargs) -> requests.Response:
+    """GET through limited_request.
+    Input: session, request url, any requests.get kwargs
+    Output: response
+    """
+    return limited_request(sess, "GET", query_url, **kwargs)
+
+
+# %%
+
+# seconds before a cached response must be revalidated, per API host
+cache_ttl = {"pypi.org": 24 * 60 * 60,
+             "api.github.com": 6 * 60 * 60,
+             "raw.githubusercontent.com": 7 * 24 * 60 * 60,
+             "api.stackexchange.com": 24 * 60 * 60,
+             }
+cache_ttl_default = 24 * 60 * 60
+
+# 404s are kept too, since most packages have no conda-forge feedstock
+cacheable_status_codes = (200, 404)
+
+
+def build_response(query_url: str, status_code: int, headers: dict, body: bytes) -> requests.Response:
+    """Rebuild a requests.Response from stored parts, so fetchers can't tell
+    a cached response from a live one.
+    Input: request url, http status, response headers, raw body
+    Output: response
+    """
+    response = requests.Response()
+    response.url = query_url
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = body
+    response._content_consumed = True  # iter_lines() reads from _content
+
+    return response
+
+
+class ResponseCache(object):
+    """SQLite-backed cache of API responses, keyed by url.
+
+    Each entry expires after its host's cache_ttl. Expired entries are not
+    dropped: their ETag/Last-Modified is sent back so the server can answer
+    304 Not Modified (free against the github rate limit). Once the file
+    grows past max_bytes, least recently used entries are evicted.
+
+    A running byte total saves summing the table on every insert, and hit
+    times are written in batches, so a cache hit costs one indexed read.
+    """
+
+    def __init__(self, cache_dir: str, max_mb: float=500, access_flush_every: int=200):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "responses.sqlite"),
+                                    check_same_thread=False)  # guarded by self.lock
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                 url TEXT PRIMARY KEY,
+                                 status_code INTEGER,
+                                 headers TEXT,
+                                 body BLOB,
+                                 size INTEGER,
+                                 expires_at REAL,
+                                 accessed_at REAL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed_at ON responses (accessed_at)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.accessed = {}  # url -> last hit time, not yet written
+        self.access_flush_every = access_flush_every
+
+    def get(self, query_url: str):
+        """Input: request url
+        Output: (response, expired) tuple, or None if url was never cached
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT status_code, headers, body, expires_at FROM responses WHERE url = ?",
+                                    (query_url,)).fetchone()
+            if row is None:
+                return None
+
+            self.accessed[query_url] = time.time()
+            if len(self.accessed) >= self.access_flush_every:
+                self.flush_accessed()
+                self.conn.commit()
+
+        status_code, headers, body, expires_at = row
+        response = build_response(query_url, status_code, json.loads(headers), body)
+
+        return response, expires_at < time.time()
+
+    def put(self, query_url: str, response: requests.Response):
+        """Store a live response, then evict old entries if over max_bytes."""
+        host = urlparse(query_url).netloc
+        now = time.time()
+        body = response.content
+        with self.lock:
+            row = self.conn.execute("SELECT size FROM responses WHERE url = ?", (query_url,)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (query_url,
+                               response.status_code,
+                               json.dumps(dict(response.headers)),
+                               body,
+                               len(body),
+                               now + cache_ttl.get(host, cache_ttl_default),
+                               now))
+            self.accessed.pop(query_url, None)
+            self.total_bytes += len(body) - (row[0] if row else 0)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+            self.conn.commit()
+
+    def refresh(self, query_url: str):
+        """Server confirmed the entry is unchanged (304), so restart its ttl."""
+        host = urlparse(query_url).netloc
+        now = time.time()
+        with self.lock:
+            self.conn.execute("UPDATE responses SET expires_at = ?, accessed_at = ? WHERE url = ?",
+                              (now + cache_ttl.get(host, cache_ttl_default), now, query_url))
+            self.accessed.pop(query_url, None)
+            self.conn.commit()
+
+    def flush_accessed(self):
+        """Write batched hit times. Caller must hold self.lock and commit."""
+        self.conn.executemany("UPDATE responses SET accessed_at = ? WHERE url = ?",
+                              [(accessed_at, url) for url, accessed_at in self.accessed.items()])
+        self.accessed = {}
+
+    def evict(self):
+        """Drop least recently used entries until under max_bytes.
+        Caller must hold self.lock.
+        """
+        self.flush_accessed()  # so recent hits aren't evicted first
+        rows = self.conn.execute("SELECT url, size FROM responses ORDER BY accessed_at")
+        evict_urls = []
+        for url, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            evict_urls.append((url,))
+            self.total_bytes -= size
+
+        self.conn.executemany("DELETE FROM responses WHERE url = ?", evict_urls)
+
+    def close(self):
+        """Writes pending hit times, then closes the database."""
+        with self.lock:
+            self.flush_accessed()
+            self.conn.commit()
+            self.conn.close()
+
+
+# disk cache, created at startup unless --no_cache is set
+response_cache = None
+
+
+def cached_get(sess: requests.Session, query_url: str, **kwargs) -> requests.Response:
+    """GET request served from response_cache when possible.
+    Fresh entries are returned without touching the network. Expired entries
+    are revalidated with If-None-Match/If-Modified-Since, and a 304 reply
+    reuses the stored body.
+    Input: session, request url, any requests.get kwargs
+    Output: response
+    """
+    if response_cache is None:
+        return limited_get(sess, query_url, **kwargs)
+
+    cached = response_cache.get(query_url)
+    if cached is not None:
+        cached_response, expired = cached
+        if not expired:
+            return cached_response
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if "ETag" in cached_response.headers:
+            headers["If-None-Match"] = cached_response.headers["ETag"]
+        if "Last-Modified" in cached_response.headers:
+            headers["If-Modified-Since"] = cached_response.headers["Last-Modified"]
+        kwargs["headers"] = headers
+
+    response = limited_get(sess, query_url, **kwargs)
+
+    if response.status_code == 304 and cached is not None:
+        response_cache.refresh(query_url)
+        return cached_response
+
+    if response.status_code in cacheable_status_codes:
+        response_cache.put(query_url, response)
+
+    return response
+
+
+class RunMemo(object):
+    """Per-run memo of responses, so each distinct url is downloaded and
+    parsed once per run. find_github_pages and pull_pypi_content both read
+    the same pypi json, which can be megabytes for long release histories.
+
+    Requests are coalesced: if a url is already being downloaded, other
+    threads wait on that download instead of starting their own.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.responses = {}  # url -> Future of response
+        self.parsed = {}  # url -> Future of parsed json
+        self.hits = 0
+        self.misses = 0
+
+    def once(self, table: dict, query_url: str, func):
+        """Run func once per url. Callers arriving while it runs share its
+        result. A failed call is forgotten, so a later caller can retry.
+        Output: (result, True if func ran in this call)
+        """
+        with self.lock:
+            future = table.get(query_url)
+            owner = future is None
+            if owner:
+                future = Future()
+                table[query_url] = future
+
+        if owner:
+            try:
+                future.set_result(func())
+            except Exception as error:
+                with self.lock:
+                    del table[query_url]
+                future.set_exception(error)
+
+        return future.result(), owner
+
+    def get(self, sess: requests.Session, query_url: str, **kwargs) -> requests.Response:
+        """Memoized cached_get.
+        Input: session, request url, any requests.get kwargs
+        Output: response
+        """
+        response, owner = self.once(self.responses, query_url,
+                                    lambda: cached_get(sess, query_url, **kwargs))
+        with self.lock:
+            if owner:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return response
+
+    def get_json(self, sess: requests.Session, query_url: str, **kwargs) -> tuple:
+        """Memoized cached_get, plus json parsed once. Data is shared between
+        callers, so treat it as read-only.
+        Input: session, request url, any requests.get kwargs
+        Output: (response, parsed json or None if request failed)
+        """
+        response = self.get(sess, query_url, **kwargs)
+        if response.status_code != 200:
+            return response, None
 
-        return github_user, github_token
+        data, owner = self.once(self.parsed, query_url, response.json)
+
+        return response, data
+
+
+run_memo = RunMemo()
+
+
+# %%
+
+# local conda-forge package index, set when --conda_channel_data is given
+conda_index = None
+
+
+def read_channel_file(path: str) -> dict:
+    """Reads a downloaded repodata.json or channeldata.json, plain or
+    compressed, e.g. https://conda.anaconda.org/conda-forge/channeldata.json
+    Input: path ending .json, .json.bz2 or .json.zst (needs zstandard)
+    Output: parsed json
+    """
+    with open(path, "rb") as file:
+        raw = file.read()
+
+    if path.endswith(".bz2"):
+        import bz2
+        raw = bz2.decompress(raw)
+    elif path.endswith(".zst"):
+        try:
+            import zstandard  # pip install zstandard
+        except ImportError:
+            raise SystemExit(f"reading {path} needs zstandard, pip install zstandard")
+        raw = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(raw)).read()
+
+    return json.loads(raw)
+
+
+def channel_file_packages(channel_data: dict) -> dict:
+    """Pulls per-package fields out of either kind of channel file.
+    repodata.json lists every build, so gives versions. channeldata.json has
+    one entry per package, so gives home and dev urls.
+    Input: parsed repodata.json or channeldata.json
+    Output: dict of package name -> {"versions", "latest", "home", "dev_url"}
+    """
+    packages = {}
+    if "packages.conda" in channel_data or "info" in channel_data:  # repodata
+        builds = {**channel_data.get("packages", {}), **channel_data.get("packages.conda", {})}
+        for build in builds.values():
+            package = packages.setdefault(build["name"], {"versions": set()})
+            package["versions"].add(build["version"])
+
+    else:  # channeldata
+        for name, entry in channel_data.get("packages", {}).items():
+            packages[name] = {"versions": {entry["version"]} if entry.get("version") else set(),
+                              "latest": entry.get("version"),
+                              "home": entry.get("home"),
+                              "dev_url": entry.get("dev_url")}
+
+    return packages
+
+
+def version_sort_key(version: str):
+    """Input: conda version string
+    Output: sort key, falling back to plain text for unparseable versions
+    """
+    try:
+        from packaging.version import Version
+        return (1, Version(version), "")
+    except Exception:
+        return (0, None, version)
+
+
+class CondaIndex(object):
+    """SQLite index of conda-forge packages built from local channel files:
+    versions, feedstock and home/dev urls per package. Conda lookups become
+    local hits instead of a feedstock repo probe and README download per
+    package. Rebuilt only when a channel file changes.
+    """
+
+    def __init__(self, cache_dir: str, channel_files: list):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "condaforge_index.sqlite"), check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS sources (
+                                 path TEXT PRIMARY KEY,
+                                 size INTEGER,
+                                 mtime_ns INTEGER)""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS packages (
+                                 name TEXT PRIMARY KEY,
+                                 versions TEXT,
+                                 latest TEXT,
+                                 feedstock TEXT,
+                                 home TEXT,
+                                 dev_url TEXT)""")
+
+        sources = set()
+        for path in channel_files:
+            stat = os.stat(path)
+            sources.add((os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+        if sources != set(self.conn.execute("SELECT path, size, mtime_ns FROM sources")):
+            self.build(channel_files, sources)
+
+    def build(self, channel_files: list, sources: set):
+        """Input: channel file paths, their (path, size, mtime_ns) entries"""
+        merged = {}
+        for path in channel_files:
+            print(f"indexing conda channel file {path}")
+            for name, package in channel_file_packages(read_channel_file(path)).items():
+                entry = merged.setdefault(name, {"versions": set()})
+                entry["versions"] |= package.pop("versions")
+                entry.update({key: value for key, value in package.items() if value})
+
+        rows = []
+        for name, entry in merged.items():
+            versions = sorted(entry["versions"], key=version_sort_key)
+            latest = entry.get("latest") or (versions[-1] if versions else None)
+            rows.append((name, json.dumps(versions), latest, f"{name}-feedstock",
+                         entry.get("home"), entry.get("dev_url")))
+
+        with self.conn:
+            self.conn.execute("DELETE FROM packages")
+            self.conn.execute("DELETE FROM sources")
+            self.conn.executemany("INSERT INTO packages VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.conn.executemany("INSERT INTO sources VALUES (?, ?, ?)", sources)
+        print(f"conda index: {len(rows)} packages")
+
+    def get(self, name: str) -> dict:
+        """Input: conda package name
+        Output: dict of versions, latest, feedstock, home and dev_url, or None
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT versions, latest, feedstock, home, dev_url FROM packages WHERE name = ?",
+                                    (name.lower(),)).fetchone()
+        if row is None:
+            return None
+
+        versions, latest, feedstock, home, dev_url = row
+        return {"versions": json.loads(versions), "latest": latest,
+                "feedstock": feedstock, "home": home, "dev_url": dev_url}
+
+
+def pull_condaforge_content(package: str, sess: requests.Session=None) -> dict:
+    """Package info from the local conda-forge index, no request made.
+    Input: package name, session unused, kept for the source_fetchers signature
+    Output: dict of condaforge_* keys
+    """
+    repo_info = {}
+    # json section: header ================================================
+    repo_info['condaforge_package'] = f"{package}"
+
+    entry = conda_index.get(package) if conda_index is not None else None
+    if entry is None:
+        repo_info['condaforge_api_status'] = "not in conda-forge index"
+        return repo_info
+
+    repo_info['condaforge_api_status'] = "success"
+
+    key_parent = 'latest'
+    repo_info[f"condaforge_{key_parent}"] = entry.get(key_parent)
+
+    key_parent = 'versions'
+    repo_info[f"condaforge_{key_parent}_count"] = len(entry.get(key_parent))
+
+    # inferred from the name, channel files don't say which feedstock builds
+    # a package, e.g. libblas comes from blas-feedstock
+    key_parent = 'feedstock'
+    repo_info[f"condaforge_{key_parent}_inferred"] = f"https://github.com/conda-forge/{entry.get(key_parent)}"
+
+    key_parent = 'home'
+    repo_info[f"condaforge_{key_parent}"] = entry.get(key_parent)
+
+    key_parent = 'dev_url'
+    repo_info[f"condaforge_{key_parent}"] = entry.get(key_parent)
+
+    # pinned version, from environment files
+    for requirement in sorted(set(module_pins["conda"].get(package, [])))[:1]:
+        repo_info['condaforge_pin'] = requirement
+        parsed = parse_requirement(requirement, conda=True)
+        if parsed is not None and parsed[1] is not None:
+            version, behind = resolve_pin(parsed[1], entry.get('versions'))
+            repo_info['condaforge_pin_version'] = version
+            repo_info['condaforge_pin_releases_behind'] = behind
+
+    return repo_info
 
 
 # %%
@@ -171,58 +1037,23 @@ def convert_github_page_to_endpoint(homepage: str):
     return query_url
 
 
-def find_github_pages(package: str) -> dict:
-    """Finds github pages listed on pypi and condaforge websites. If they list
-    the same github page, only one page is returned.
-    
-    Conda-forge raw readme link:
-    Read from condaforge raw feedstock readme.md file, parse for developer site,
-    then feed this url to github API.
-    Example file to be parsed:
-    https://raw.githubusercontent.com/conda-forge/setuptools-feedstock/main/README.md
-    
-    Input: package name
-    Output: dictionary of 1 or 2 github urls
+def find_condaforge_pages(package: str, sess: requests.Session) -> dict:
+    """Probes the package's conda-forge feedstock repo, then reads the
+    feedstock readme for the development site.
+    Input: package name, session
+    Output: dict of github_page_condaforge_repo and github_page_condaforge urls, if found
     """
-
     repo_info = {}
 
-    # find github page on pypi
-    query_url = f"https://pypi.org/pypi/{package}/json"
-    sess = requests.Session()
-    response = sess.get(query_url, stream=True)  # stream until website found
-
-    # ensure request succeeds
-    if response.status_code != 200:  #  request failed
-        next
-
-    else:   # request succeeded
-        data = response.json()
-        try:  # if parent is None, error
-            key_parent = 'info'
-            key_child = 'project_urls'
-            key_grandchild = 'Homepage'
-            homepage = data.get(key_parent).get(key_child).get(key_grandchild)
-            if '://github.com/' in homepage:
-                query_url = convert_github_page_to_endpoint(homepage)
-                repo_info['github_page_pypi'] = query_url
-            # else:
-                # repo_info['github_page_pypi'] = "None"
-
-        except:
-            print(f"pypi call {package} for github page failed")
-
     # TODO: get conda-forge github page
     query_url = f"https://api.github.com/repos/conda-forge/{package}-feedstock"
-    sess = requests.Session()
-    response = sess.get(query_url, stream=True)  # stream until website found
+    response = run_memo.get(sess, query_url)
 
     # ensure request succeeds
     if response.status_code != 200:  #  request failed
         next
 
     else:  # request succeeded
-        data = response.json()
         try:  # if parent is None, error
             repo_info['github_page_condaforge_repo'] = query_url
 
@@ -231,8 +1062,7 @@ def find_github_pages(package: str) -> dict:
 
     # find github homepage page on condaforge
     query_url = f"https://raw.githubusercontent.com/conda-forge/{package}-feedstock/main/README.md"
-    sess = requests.Session()
-    response = sess.get(query_url, stream=True)  # stream until website found
+    response = run_memo.get(sess, query_url)
 
     # ensure request succeeds
     if response.status_code != 200:  #  request failed
@@ -252,13 +1082,83 @@ def find_github_pages(package: str) -> dict:
                     # repo_info['github_page_condaforge'] = "None"
             else:
                 continue  # return to `if`
+
+    return repo_info
+
+
+def find_condaforge_pages_local(package: str) -> dict:
+    """Like find_condaforge_pages, from the local conda-forge index. The
+    feedstock repo is left out, since the index only infers its name, and
+    a wrong guess would be recorded as a failed lookup and retried on
+    every --resume.
+    Input: package name
+    Output: dict with the github_page_condaforge url, if found
+    """
+    repo_info = {}
+    entry = conda_index.get(package)
+    if entry is None:
+        return repo_info
+
+    for homepage in (entry['dev_url'], entry['home']):
+        if homepage and '://github.com/' in homepage:
+            repo_info['github_page_condaforge'] = convert_github_page_to_endpoint(homepage)
+            break
+
+    return repo_info
+
+
+def find_github_pages(package: str, sess: requests.Session=None) -> dict:
+    """Finds github pages listed on pypi and condaforge websites. If they list
+    the same github page, only one page is returned.
+    
+    Conda-forge raw readme link:
+    Read from condaforge raw feedstock readme.md file, parse for developer site,
+    then feed this url to github API.
+    Example file to be parsed:
+    https://raw.githubusercontent.com/conda-forge/setuptools-feedstock/main/README.md
     
+    Input: package name, optional session (defaults to shared client)
+    Output: dictionary of 1 or 2 github urls
+    """
+
+    sess = sess or get_http_client()
+    repo_info = {}
+
+    # find github page on pypi
+    query_url = f"https://pypi.org/pypi/{package}/json"
+    response, data = run_memo.get_json(sess, query_url)
+
+    # ensure request succeeds
+    if response.status_code != 200:  #  request failed
+        next
+
+    else:   # request succeeded
+        try:  # if parent is None, error
+            key_parent = 'info'
+            key_child = 'project_urls'
+            key_grandchild = 'Homepage'
+            homepage = data.get(key_parent).get(key_child).get(key_grandchild)
+            if '://github.com/' in homepage:
+                query_url = convert_github_page_to_endpoint(homepage)
+                repo_info['github_page_pypi'] = query_url
+            # else:
+                # repo_info['github_page_pypi'] = "None"
+
+        except:
+            print(f"pypi call {package} for github page failed")
+
+    # conda-forge feedstock repo and the dev site its readme links to
+    if conda_index is not None:
+        repo_info.update(find_condaforge_pages_local(package))
+    else:
+        repo_info.update(find_condaforge_pages(package, sess))
+
     # if both pypi and condaforge return same dev site, return one
     if 'github_page_pypi' in repo_info and \
         'github_page_condaforge' in repo_info and \
         repo_info['github_page_pypi'] == repo_info['github_page_condaforge']:
 
-        repo_info['github_page_pypi_condaforge'] = query_url
+        repo_info['github_page_pypi_condaforge'] = repo_info['github_page_condaforge']
         del repo_info['github_page_pypi'], repo_info['github_page_condaforge']
     
     print(repo_info)
@@ -269,7 +1169,77 @@ def find_github_pages(package: str) -> dict:
 # %%
 
 
-def pull_github_content(query_url: str) -> dict:
+def parse_github_repo(repo: str, github_data: dict) -> dict:
+    """Pick repo stats out of a GitHub REST repo payload.
+    Input: repo name, json from https://api.github.com/repos/{owner}/{repo}
+    Output: dict of github_* repo stats
+    """
+    github_repo_info = {}
+
+    # json section: header ================================================
+    github_repo_info['github_package'] = f"{repo}"
+    github_repo_info['github_header'] = f"Info about {repo}"
+
+    key_parent = 'description'
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    key_parent = "created_at"
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    # calc days since creation=============================================
+    delta = calc_delta_days(github_data.get(key_parent))
+    github_repo_info[f"github_{key_parent}_delta"] = delta
+
+    key_parent = "updated_at"  # string = 2021-04-03T22:01:26Z
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    # calc days since update===============================================
+    delta = calc_delta_days(github_data.get(key_parent))
+    github_repo_info[f"github_{key_parent}_delta"] = delta
+
+    # watcher count
+    key_parent = "subscribers_count"
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    # user show of support
+    key_parent = "stargazers_count"
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    # open_issues_count = issues + pull requests
+    key_parent = "has_issues"
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    key_parent = "open_issues_count"
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    key_parent = "open_issues"  # repeat?
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    key_parent = "has_projects"
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    key_parent = "has_downloads"
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    key_parent = "has_wiki"
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    key_parent = "allow_forking"
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    key_parent = "fork"
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    key_parent = "forks_count"
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    key_parent = "forks"  # repeat?
+    github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+
+    return github_repo_info
+
+
+def pull_github_content(query_url: str, sess: requests.Session=None) -> dict:
     """Pull repo stats using GitHub API. This provides stats not available via
     other pypi/conda repo API calls.
     Input:
@@ -284,9 +1254,9 @@ def pull_github_content(query_url: str) -> dict:
     owner = owner_repo.split('/')[0]  # jupyter-widgets
     repo = owner_repo.split('/')[1]  # ipywidgets
 
-    sess = requests.Session()
+    sess = sess or get_http_client()
     # sess.proxies = proxies
-    response = sess.get(query_url, auth=token_in_env(True))
+    response, github_data = run_memo.get_json(sess, query_url)
 
     # loop through json elements and populate dict
     github_repo_info = {}
@@ -298,231 +1268,1441 @@ def pull_github_content(query_url: str) -> dict:
     if response.status_code != 200:  #  request failed
         github_repo_info['github_api_status'] = "fail"
 
-    else:  # request succeeded
-        github_data = response.json()
+    else:  # request succeeded
+        github_repo_info['github_api_status'] = "success"
+
+        github_repo_info.update(parse_github_repo(repo, github_data))
+
+        github_repo_info.update(pull_github_commit_activity(owner, repo, sess))
+
+    return github_repo_info
+
+
+# recent activity windows, in days
+commit_windows = [30, 90, 365]
+
+
+def commit_window_since(days: int) -> str:
+    """Start of an activity window, rounded to midnight utc so the request
+    url, and so the cache key, stays the same all day.
+    Input: window length in days
+    Output: timestamp string, e.g. 2022-10-01T00:00:00Z
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    return since.strftime('%Y-%m-%dT00:00:00Z')
+
+
+def count_commits(query_url: str, sess: requests.Session) -> int:
+    """Count commits without downloading them. With per_page=1, the page
+    number of the Link header's last page equals the commit count.
+    Input: commits endpoint url ending in per_page=1, session
+    Output: commit count, or None if the request failed
+    """
+    response, github_data = run_memo.get_json(sess, query_url)
+    if response.status_code != 200:  # fails on empty repos too
+        return None
+
+    last_page = response.links.get("last")
+    if last_page is None:  # everything fit on one page
+        return len(github_data)
+
+    return int(parse_qs(urlparse(last_page["url"]).query)["page"][0])
+
+
+def commit_activity_keys(total: int, window_counts: dict) -> dict:
+    """Input: total commit count, dict of window days -> commit count
+    Output: dict of github_commits_* keys
+    """
+    github_repo_info = {}
+
+    key_parent = "commits_total"
+    github_repo_info[f"github_{key_parent}"] = total
+
+    # kept for older outputs, which counted the first page of 30 commits
+    key_parent = "commits_max_30"
+    github_repo_info[f"github_{key_parent}"] = min(total, 30)
+
+    for days, count in window_counts.items():
+        key_parent = f"commits_last_{days}_days"
+        github_repo_info[f"github_{key_parent}"] = count
+
+    return github_repo_info
+
+
+def pull_github_commit_activity(owner: str, repo: str, sess: requests.Session) -> dict:
+    """Total commits plus commits in each of commit_windows, at one tiny
+    request each, instead of downloading a page of full commit objects.
+    Input: repo owner, repo name, session
+    Output: dict of github_commits_* keys, empty if the repo has no commits
+    """
+    query_url = f"https://api.github.com/repos/{owner}/{repo}/commits?per_page=1"
+    total = count_commits(query_url, sess)
+    if total is None:
+        return {}
+
+    window_counts = {}
+    for days in commit_windows:
+        since = commit_window_since(days)
+        window_counts[days] = count_commits(f"{query_url}&since={since}", sess)
+
+    return commit_activity_keys(total, window_counts)
+
+
+# %%
+
+# GitHub GraphQL backend, selected with --github_api graphql
+github_backend = "rest"
+github_graphql_url = "https://api.github.com/graphql"
+graphql_batch_size = 50  # repos per query
+
+graphql_repo_fields = """
+    description createdAt updatedAt
+    watchers { totalCount }
+    stargazerCount
+    hasIssuesEnabled hasProjectsEnabled hasWikiEnabled
+    issues(states: OPEN) { totalCount }
+    pullRequests(states: OPEN) { totalCount }
+    forkingAllowed isFork forkCount
+    defaultBranchRef { target { ... on Commit { total: history { totalCount } %s } } }
+"""
+
+
+def graphql_commit_window_fields() -> str:
+    """Output: one aliased history(since:) count per commit window"""
+    return " ".join(f"last_{days}_days: history(since: \"{commit_window_since(days)}\") {{ totalCount }}"
+                    for days in commit_windows)
+
+
+def graphql_repo_to_rest(repo_data: dict) -> dict:
+    """Rename GraphQL repo fields to their REST names, so parse_github_repo
+    can read either.
+    Input: one repository object from a GraphQL response
+    Output: dict shaped like a REST repo payload
+    """
+    # REST open_issues_count = issues + pull requests
+    open_issues = repo_data["issues"]["totalCount"] + repo_data["pullRequests"]["totalCount"]
+
+    return {"description": repo_data["description"],
+            "created_at": repo_data["createdAt"],
+            "updated_at": repo_data["updatedAt"],
+            "subscribers_count": repo_data["watchers"]["totalCount"],
+            "stargazers_count": repo_data["stargazerCount"],
+            "has_issues": repo_data["hasIssuesEnabled"],
+            "open_issues_count": open_issues,
+            "open_issues": open_issues,
+            "has_projects": repo_data["hasProjectsEnabled"],
+            "has_downloads": None,  # not exposed by GraphQL
+            "has_wiki": repo_data["hasWikiEnabled"],
+            "allow_forking": repo_data["forkingAllowed"],
+            "fork": repo_data["isFork"],
+            "forks_count": repo_data["forkCount"],
+            "forks": repo_data["forkCount"],
+            }
+
+
+def pull_github_content_graphql(query_urls: list, sess: requests.Session=None) -> dict:
+    """Pull repo stats for many repos in a single GitHub GraphQL query, instead
+    of two REST calls per repo. Results use the same github_* keys as
+    pull_github_content. GraphQL requires a token.
+    Input: list of https://api.github.com/repos/{owner}/{repo} urls,
+        at most graphql_batch_size
+    Output: dict of url -> repo stats. Urls GraphQL couldn't answer are left out
+    """
+    if not github_credentials.tokens:
+        print("github graphql needs a token, using REST")
+        return {}
+
+    repo_fields = graphql_repo_fields % graphql_commit_window_fields()
+    repos = {}
+    query_parts = []
+    for i, query_url in enumerate(query_urls):
+        owner_repo = query_url.split('://api.github.com/repos/')[1]  # jupyter-widgets/ipywidgets
+        owner, repo = owner_repo.split('/')[:2]
+        repos[f"r{i}"] = (query_url, repo)
+        # json strings are valid graphql string literals
+        query_parts.append(f"r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(repo)}) {{ {repo_fields} }}")
+
+    sess = sess or get_http_client()
+    response = limited_request(sess, "POST", github_graphql_url,
+                               json={"query": "query { " + " ".join(query_parts) + " }"})
+
+    if response.status_code != 200:
+        print(f"github graphql request failed with {response.status_code}, using REST")
+        return {}
+
+    data = response.json().get("data") or {}
+
+    github_repo_infos = {}
+    for alias, (query_url, repo) in repos.items():
+        repo_data = data.get(alias)
+        if repo_data is None:  # not found, or query error for this repo
+            continue
+
+        github_repo_info = {}
+        github_repo_info["github_api_url_repo"] = query_url
+        github_repo_info['github_api_status'] = "success"
+        github_repo_info.update(parse_github_repo(repo, graphql_repo_to_rest(repo_data)))
+
+        branch = repo_data["defaultBranchRef"]
+        if branch is not None:  # empty repos have no branch
+            history = branch["target"]
+            window_counts = {days: history[f"last_{days}_days"]["totalCount"] for days in commit_windows}
+            github_repo_info.update(commit_activity_keys(history["total"]["totalCount"], window_counts))
+
+        github_repo_infos[query_url] = github_repo_info
+
+    return github_repo_infos
+
+
+def pull_github_pages_graphql(results: dict, pool: ThreadPoolExecutor):
+    """In graphql mode, the github source only finds each module's github
+    pages. This swaps every found page url for its repo stats, querying all
+    unique repos in batches, and falling back to REST for repos the batches
+    didn't answer.
+    Input: fetch_modules results dict, modified in place; thread pool
+    """
+    page_urls = []
+    for (module, source), github_pages in results.items():
+        if source == "github":
+            for key, page_url in github_pages.items():
+                if key.startswith("github_page"):
+                    page_urls.append(page_url)
+    page_urls = list(dict.fromkeys(page_urls))  # several modules may share a repo
+
+    def graphql_batch(batch: list) -> dict:
+        try:
+            return pull_github_content_graphql(batch, get_http_client())
+        except requests.RequestException as error:
+            print(f"github graphql request failed: {error}, using REST")
+            return {}
+
+    def rest_single(page_url: str) -> dict:
+        try:
+            return pull_github_content(page_url, get_http_client())
+        except requests.RequestException as error:
+            print(f"github request {page_url} failed: {error}")
+            return {"github_api_url_repo": page_url, "github_api_status": "fail"}
+
+    batches = [page_urls[i:i + graphql_batch_size] for i in range(0, len(page_urls), graphql_batch_size)]
+    repo_infos = {}
+    for batch_infos in pool.map(graphql_batch, batches):
+        repo_infos.update(batch_infos)
+
+    missing = [page_url for page_url in page_urls if page_url not in repo_infos]
+    repo_infos.update(zip(missing, pool.map(rest_single, missing)))
+
+    for (module, source), github_pages in results.items():
+        if source == "github":
+            for key, page_url in github_pages.items():
+                if key.startswith("github_page"):
+                    github_pages[key] = repo_infos[page_url]
+
+
+# %%
+
+
+def pull_stackoverflow_content(package: str, sess: requests.Session=None) -> dict:
+    """Pull package info using Stackoverflow API.
+    API limit is 300 requests/day. OAuth registration requires a domain.
+    Example endpoint:
+    https://api.stackexchange.com/2.3/packages/{package}/info?site=stackoverflow
+    https://stackoverflow.com/questions/packages/{package}
+
+    Input: library name as string
+    Output: dict of stackoverflow stats
+    """
+
+    package = package  # search SO for package name as package
+    query_url = f"https://api.stackexchange.com/2.3/tags?inname={package}&site=stackoverflow"
+    sess = sess or get_http_client()
+    response, data = run_memo.get_json(sess, query_url)
+
+    package_info = {}
+    # json section: header ================================================
+    package_info['stackoverflow_package'] = f"{package}"
+
+    # ensure request succeeds
+    if response.status_code != 200:  #  request failed
+        package_info['stackoverflow_api_status'] = "fail"
+
+    else:  # request succeeded
+        try:
+            data = data['items'][0]  # items contains a list of length 1!
+            package_info.update(parse_stackoverflow_tag(query_url, data))
+
+        except IndexError:
+            package_info['stackoverflow_api_status'] = "stackoverflow package returned no results"
+
+    return package_info
+
+
+def parse_stackoverflow_tag(query_url: str, tag_data: dict) -> dict:
+    """Input: request url, one tag item from a stackexchange response
+    Output: dict of stackoverflow tag stats
+    """
+    package_info = {}
+    package_info['stackoverflow_api_status'] = "success"
+
+    package_info['stackoverflow_api_call'] = query_url
+
+    key_parent = 'name'
+    package_info[f"stackoverflow_{key_parent}"] = tag_data.get(key_parent)
+
+    key_parent = 'has_synonyms'
+    package_info[f"stackoverflow_{key_parent}"] = tag_data.get(key_parent)
+
+    key_parent = 'count'
+    package_info[f"stackoverflow_{key_parent}"] = tag_data.get(key_parent)
+
+    return package_info
+
+
+# stackoverflow lookup mode, overwritten by CLI option
+stackoverflow_lookup = "batch"
+stackoverflow_batch_size = 100  # max tags per /tags/{tags}/info call
+
+
+def package_to_tag(package: str) -> str:
+    """Stack Overflow tags are lowercase and use hyphens, not underscores.
+    Input: package name
+    Output: tag name
+    """
+    return package.strip().lower().replace("_", "-")
+
+
+def pull_stackoverflow_content_batch(packages: list, sess: requests.Session=None) -> dict:
+    """Look up many packages' tags in one /tags/{tag1;tag2;...}/info call,
+    instead of a fuzzy inname= search per package. Only exact tag name
+    matches count, so `pull_stackoverflow_content` still handles misses.
+    Input: list of package names, at most stackoverflow_batch_size
+    Output: dict of package -> stackoverflow stats, for matched packages only
+    """
+    tags = {package_to_tag(package): package for package in packages}
+    tag_list = ";".join(quote(tag, safe="") for tag in tags)
+    query_url = f"https://api.stackexchange.com/2.3/tags/{tag_list}/info?pagesize={stackoverflow_batch_size}&site=stackoverflow"
+
+    sess = sess or get_http_client()
+    response, data = run_memo.get_json(sess, query_url)
+
+    package_infos = {}
+    if response.status_code != 200:  #  request failed, all fall back
+        return package_infos
+
+    for tag_data in data.get('items', []):
+        package = tags.get(tag_data.get('name'))
+        if package is not None:
+            package_info = {}
+            package_info['stackoverflow_package'] = f"{package}"
+            package_info.update(parse_stackoverflow_tag(query_url, tag_data))
+            package_infos[package] = package_info
+
+    return package_infos
+
+
+def prefetch_stackoverflow_batches(packages: list, pool: ThreadPoolExecutor) -> dict:
+    """Run pull_stackoverflow_content_batch over all packages.
+    Input: list of package names, thread pool
+    Output: dict of package -> stackoverflow stats, for matched packages only
+    """
+    def batch_lookup(batch: list) -> dict:
+        try:
+            return pull_stackoverflow_content_batch(batch, get_http_client())
+        except requests.RequestException as error:
+            print(f"stackoverflow batch request failed: {error}")
+            return {}
+
+    packages = sorted(packages)  # same packages give the same urls, so the cache hits
+    batches = [packages[i:i + stackoverflow_batch_size] for i in range(0, len(packages), stackoverflow_batch_size)]
+    package_infos = {}
+    for batch_infos in pool.map(batch_lookup, batches):
+        package_infos.update(batch_infos)
+
+    print(f"stackoverflow batches: {len(package_infos)} of {len(packages)} exact tag matches")
+
+    return package_infos
+
+
+# %%
+
+try:
+    import ijson  # pip install ijson, streams pypi json instead of loading it whole
+except ImportError:
+    ijson = None
+
+# the only pypi json fields any fetcher reads
+pypi_info_fields = ["name", "version", "summary", "home_page", "project_urls",
+                    "requires_python", "requires_dist", "yanked", "yanked_reason"]
+
+
+def slim_pypi_json(data: dict) -> dict:
+    """Input: parsed pypi json, full or partial
+    Output: pypi_info_fields of info, vulnerabilities, and per release only
+        whether every file was yanked and the first upload time
+    """
+    slim = {"info": {key: (data.get("info") or {}).get(key) for key in pypi_info_fields},
+            "vulnerabilities": data.get("vulnerabilities", [])}
+
+    if "releases" in data:
+        slim["releases"] = {}
+        for version, files in data["releases"].items():
+            uploads = [file.get("upload_time_iso_8601") for file in files if file.get("upload_time_iso_8601")]
+            slim["releases"][version] = [{"yanked": bool(files) and all(file.get("yanked") for file in files),
+                                          "upload_time_iso_8601": min(uploads) if uploads else None}]
+
+    return slim
+
+
+def stream_pypi_json(raw) -> dict:
+    """Pull the slim_pypi_json fields out of a pypi json document while it
+    downloads. Release file lists, the bulk of the document for packages like
+    boto3, are never held in memory, and reading stops once vulnerabilities,
+    the last field needed, has been read.
+    Input: file-like response body
+    Output: slim pypi json
+    """
+    data = {}
+    releases = {}  # version -> list of release files, cut down to the slim fields
+    builder = None  # builds info/vulnerabilities, which are small
+    field = None
+    file_prefix = None
+    keep_prefixes = {}
+
+    for prefix, event, value in ijson.parse(raw, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == field and event in ("end_map", "end_array"):
+                data[field] = builder.value
+                builder = None
+                if field == "vulnerabilities":
+                    break  # everything needed is read
+
+        elif prefix in ("info", "vulnerabilities") and event in ("start_map", "start_array"):
+            field = prefix
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+
+        elif prefix == "releases" and event == "map_key":  # versions hold dots, so track by state
+            files = releases[value] = []
+            file_prefix = f"releases.{value}.item"
+            keep_prefixes = {f"{file_prefix}.yanked": "yanked",
+                             f"{file_prefix}.upload_time_iso_8601": "upload_time_iso_8601"}
+
+        elif prefix in keep_prefixes:
+            files[-1][keep_prefixes[prefix]] = value
+
+        elif prefix == file_prefix and event == "start_map":
+            files.append({})
+
+    if releases:  # version json has no release list
+        data["releases"] = releases
+
+    return slim_pypi_json(data)
+
+
+def read_pypi_json(raw) -> bytes:
+    """Body filter for pypi json responses, see limited_request. Streams with
+    ijson when installed, else parses the whole document, but either way only
+    the slim fields are kept, in run memo and response cache alike.
+    Input: file-like response body
+    Output: slim json body
+    """
+    if ijson is not None:
+        slim = stream_pypi_json(raw)
+    else:
+        slim = slim_pypi_json(json.load(raw))
+
+    return json.dumps(slim).encode("utf-8")
+
+
+def get_body_filter(query_url: str):
+    """Input: request url
+    Output: function reading a streamed response body into the body to keep,
+        or None to read the body as is
+    """
+    parsed = urlparse(query_url)
+    if parsed.netloc == "pypi.org" and parsed.path.startswith("/pypi/") and parsed.path.endswith("/json"):
+        return read_pypi_json
+
+    return None
+
+
+def pull_pypi_content(package: str, sess: requests.Session=None) -> dict:
+    """Given a package name, function queries pypi repo for selected fields.
+    Pypi repo typically contains the official dev site for each package. This
+    site is read in, and if it links to a Github page, the function then
+    queries Github API.
+    """
+
+    pypi_results = {}
+
+    query_url = f"https://pypi.org/pypi/{package}/json"
+    sess = sess or get_http_client()
+    response, data = run_memo.get_json(sess, query_url)
+
+    repo_info = {}
+    # json section: header ================================================
+    repo_info['pypi_package'] = f"{package}"
+    repo_info['pypi_header'] = f"Info about {package}"
+
+    # ensure request succeeds
+    if response.status_code != 200:  #  request failed
+        repo_info['pypi_api_status'] = "fail"
+
+    else:  # request succeeded
+        repo_info['pypi_api_status'] = "success"
+
+        # json section: info ==================================================
+        key_parent = 'info'
+
+        # Note: get() overcomes missing keys. For nested keys, use many gets
+        key_child = 'summary'
+        repo_info[f"pypi_{key_parent}_{key_child}"] = data.get(key_parent).get(key_child)
+
+        key_child = 'requires_python'
+        repo_info[f"pypi_{key_parent}_{key_child}"] = data.get(key_parent).get(key_child)
+
+        key_child = 'requires_dist'
+        # repo_info[f"pypi_{key_parent}_{key_child}"] = data.get(key_parent).get(key_child)
+        repo_info[f"pypi_{key_parent}_{key_child}"] = str(data.get(key_parent).get(key_child))  # formatting variation
+
+        key_child = 'yanked'
+        repo_info[f"pypi_{key_parent}_{key_child}"] = data.get(key_parent).get(key_child)
+
+        # json section: vulnerabilities =======================================
+        key_parent = 'vulnerabilities'
+        repo_info[f"pypi_{key_parent}"] = data.get(key_parent)
+
+        # json section: info github============================================
+        key_parent = 'info'
+
+        # json section: pinned release, from environment files ================
+        repo_info.update(pull_pypi_pins(package, data, sess))
+
+    pypi_results["pypi"] = repo_info
+
+    return pypi_results
+
+
+# %%
+
+try:
+    from packaging.requirements import Requirement, InvalidRequirement
+    from packaging.specifiers import SpecifierSet, InvalidSpecifier
+    from packaging.version import Version, InvalidVersion
+    from packaging.utils import canonicalize_name
+except ImportError:  # pip install packaging
+    Requirement = None
+
+    def canonicalize_name(name: str) -> str:
+        """PEP 503 normalized name, as packaging.utils does"""
+        return re.sub(r"[-_.]+", "-", name).lower()
+
+# requirement strings per module from environment files, by installer,
+# e.g. {"conda": {"numpy": ["numpy=1.21"]}, "pip": {}}, filled by get_yml_modules
+module_pins = {"conda": {}, "pip": {}}
+
+
+def strip_conda_channel(text: str) -> str:
+    """Input: conda match spec, e.g. conda-forge::numpy=1.2 or numpy[build=py*]
+    Output: spec without the channel prefix and bracketed build options
+    """
+    return re.sub(r"\[.*\]\s*$", "", text.rpartition("::")[2]).strip()
+
+
+def parse_requirement(text: str, conda: bool=False) -> tuple:
+    """Parse a pip requirement (==, >=, ~=, ...) or conda match spec, where
+    `name=1.2` means any 1.2.x, `name=1.2=build` pins a build and
+    `name 1.2.*` has no operator. A conda `channel::` prefix is ignored.
+    Input: requirement string, conda=True for conda syntax
+    Output: (lowercase name, SpecifierSet or None if unpinned), or None if
+        it can't be parsed
+    """
+    if Requirement is None:
+        return None
+
+    text = text.split("#")[0].strip()
+    if conda:
+        text = strip_conda_channel(text)
+        match = re.match(r"^([A-Za-z0-9_.\-]+)\s*(.*)$", text)
+        if match is None:
+            return None
+        name, spec = match.group(1), match.group(2).strip()
+
+        if spec.startswith("=") and not spec.startswith("=="):
+            version, _, build = spec[1:].partition("=")
+            if not build and not version.endswith("*"):
+                version += ".*"  # conda =1.2 is fuzzy
+            spec = f"=={version}"
+        elif spec[:1].isdigit():
+            spec = f"=={spec}"
+
+        try:
+            return name.lower(), SpecifierSet(spec.replace(" ", "")) if spec else None
+        except InvalidSpecifier:
+            return None
+
+    try:
+        requirement = Requirement(text)
+    except InvalidRequirement:
+        return None
+
+    return requirement.name.lower(), requirement.specifier if str(requirement.specifier) else None
+
+
+def resolve_pin(specifier, versions: list) -> tuple:
+    """Which release a requirement installs today, and how many newer final,
+    not yanked, releases there are.
+    Input: SpecifierSet, list of version strings, e.g. pypi release keys
+    Output: (resolved version string or None, releases behind latest or None)
+    """
+    parsed = {}
+    for version in versions:
+        try:
+            parsed[version] = Version(version)
+        except InvalidVersion:
+            continue
+
+    # pre-releases only if the specifier names one or nothing else matches, as pip does
+    matching = list(specifier.filter(list(parsed)))
+    if not matching:
+        return None, None
+
+    pinned = max(matching, key=parsed.get)
+    newer = [version for version in parsed
+             if parsed[version] > parsed[pinned] and not parsed[version].is_prerelease]
+
+    return pinned, len(newer)
+
+
+def pull_pypi_pin_content(package: str, requirement: str, data: dict, sess: requests.Session) -> dict:
+    """Pin details from /pypi/{package}/{version}/json, which is small next
+    to the project json: yanked status and known vulnerabilities of the
+    pinned release, plus releases behind, from the project json's releases.
+    Input: package name, requirement string, project json, session
+    Output: dict of pypi_pin_* keys
+    """
+    pin_info = {}
+    pin_info['pypi_pin'] = requirement
+
+    parsed = parse_requirement(requirement)
+    if parsed is None or parsed[1] is None:
+        pin_info['pypi_pin_api_status'] = "unpinned or unparseable requirement"
+        return pin_info
+
+    # fully yanked releases don't count, pip skips them
+    releases = {version: files for version, files in data.get('releases', {}).items()
+                if not (files and all(file.get('yanked') for file in files))}
+    version, behind = resolve_pin(parsed[1], list(releases))
+    if version is None:  # pinned to a yanked release
+        version, behind = resolve_pin(parsed[1], list(data.get('releases', {})))
+    if version is None:
+        pin_info['pypi_pin_api_status'] = "no release matches requirement"
+        return pin_info
+
+    pin_info['pypi_pin_version'] = version
+    pin_info['pypi_pin_releases_behind'] = behind
+
+    query_url = f"https://pypi.org/pypi/{package}/{version}/json"
+    response, version_data = run_memo.get_json(sess, query_url)
+    if response.status_code != 200:  #  request failed
+        pin_info['pypi_pin_api_status'] = "fail"
+        return pin_info
+
+    pin_info['pypi_pin_api_status'] = "success"
+
+    key_parent = 'info'
+
+    key_child = 'yanked'
+    pin_info[f"pypi_pin_{key_child}"] = version_data.get(key_parent).get(key_child)
+
+    key_child = 'yanked_reason'
+    pin_info[f"pypi_pin_{key_child}"] = version_data.get(key_parent).get(key_child)
+
+    key_child = 'requires_python'
+    pin_info[f"pypi_pin_{key_child}"] = version_data.get(key_parent).get(key_child)
+
+    key_parent = 'vulnerabilities'
+    vulnerabilities = version_data.get(key_parent) or []
+    pin_info[f"pypi_pin_{key_parent}"] = [vulnerability.get('id') for vulnerability in vulnerabilities]
+    pin_info[f"pypi_pin_{key_parent}_fixed_in"] = sorted({fixed for vulnerability in vulnerabilities
+                                                          for fixed in vulnerability.get('fixed_in') or []})
+
+    return pin_info
+
+
+def pull_pypi_pins(package: str, data: dict, sess: requests.Session) -> dict:
+    """Pin details for each distinct requirement on package in the scanned
+    environment files. Top-level keys describe the pin furthest behind, the
+    pypi_pins list has them all when files disagree.
+    Input: package name, project json, session
+    Output: dict of pypi_pin_* keys, empty if the package isn't pinned
+    """
+    pins = [pull_pypi_pin_content(package, requirement, data, sess)
+            for requirement in sorted(set(module_pins["pip"].get(package, [])))]
+    if not pins:
+        return {}
+
+    pin_info = dict(max(pins, key=lambda pin: pin.get('pypi_pin_releases_behind') or 0))
+    if len(pins) > 1:
+        pin_info['pypi_pins'] = pins
+
+    return pin_info
+
+
+# %%
+
+
+def pull_github_pages_content(package: str, sess: requests.Session=None) -> dict:
+    """Find the package's github pages, then pull repo stats for each.
+    Input: package name, optional session (defaults to shared client)
+    Output: dict of github page key and pulled repo content
+    """
+    github_pages = find_github_pages(package, sess)
+
+    # get all homepages and make github endpoint calls
+    for key, homepage in github_pages.items():
+        github_pages[key] = pull_github_content(homepage, sess)
+
+    return github_pages
+
+
+# each source is one independent lookup per module
+source_fetchers = {"stackoverflow": pull_stackoverflow_content,
+                   "pypi": pull_pypi_content,
+                   "github": pull_github_pages_content,
+                   "condaforge": pull_condaforge_content,  # local index, no request
+                   }
+
+
+def fetch_source(module: str, source: str) -> dict:
+    """Run one source lookup for one module. A network error fails only this
+    lookup, not the whole scan.
+    Input: module name, source name from source_fetchers
+    Output: dict of pulled content
+    """
+    fetcher = source_fetchers[source]
+    if source == "github" and github_backend == "graphql":
+        fetcher = find_github_pages  # repo stats are batched afterwards
+
+    try:
+        return fetcher(module, get_http_client())
+
+    except requests.RequestException as error:
+        print(f"{source} request {module} failed: {error}")
+        return {f"{source}_api_status": "fail"}
+
+
+def assemble_module(module: str, sources: list, results: dict) -> dict:
+    """Input: module name, its sources, fetch_modules results dict
+    Output: stackoverflow keys at top level, other sources nested under their name
+    """
+    content = {}
+    for source in sources:
+        if source == "stackoverflow":
+            content.update(results[(module, source)])
+        else:
+            content[source] = results[(module, source)]
+
+    return content
+
+
+def fetch_modules(module_sources: dict, on_module=None, checkpoint=None, keep: bool=True) -> dict:
+    """Fan out every (module, source) lookup across a thread pool, then
+    assemble results into the same per-module shape the sequential code built:
+    stackoverflow keys at top level, other sources nested under their name.
+
+    Input: dict of module name -> list of sources,
+        e.g. {"pandas": ["stackoverflow", "pypi", "github"]},
+        on_module(module, content) called as soon as each module's lookups finish,
+        checkpoint to restore successful lookups from and record new ones to,
+        keep=False to drop each module's results once on_module has them
+    Output: dict of module name -> pulled content, in input order,
+        empty with keep=False
+    """
+    if not module_sources:
+        return {}
+
+    results = {}
+    emitted = set()
+
+    restored = set()
+    if checkpoint is not None:
+        for module, sources in module_sources.items():
+            for source in sources:
+                content = checkpoint.get(module, source)
+                if content is not None:
+                    results[(module, source)] = content
+                    restored.add((module, source))
+        if restored:
+            print(f"resumed {len(restored)} lookups from {checkpoint.path}")
+
+    def record(module: str, source: str):
+        if checkpoint is not None:
+            checkpoint.record(module, source, results[(module, source)])
+
+    def emit_if_done(module: str, final: bool=False):
+        sources = module_sources[module]
+        if module in emitted:
+            return
+        if any((module, source) not in results for source in sources):
+            return
+        if github_backend == "graphql" and "github" in sources and not final \
+                and (module, "github") not in restored:
+            return  # repo stats arrive after the graphql batches
+        emitted.add(module)
+        if on_module is not None:
+            on_module(module, assemble_module(module, sources, results))
+        if not keep:  # streamed, so memory stays flat however big the scan
+            for source in sources:
+                del results[(module, source)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for module in module_sources:
+            emit_if_done(module)  # finished in an earlier run
+
+        if stackoverflow_lookup == "batch":
+            so_modules = [module for module, sources in module_sources.items()
+                          if "stackoverflow" in sources and (module, "stackoverflow") not in results]
+            for module, package_info in prefetch_stackoverflow_batches(so_modules, pool).items():
+                results[(module, "stackoverflow")] = package_info
+                record(module, "stackoverflow")
+            for module in so_modules:
+                emit_if_done(module)
+
+        futures = {}
+        for module, sources in module_sources.items():
+            for source in sources:
+                if (module, source) in results:  # answered by a batch or checkpoint
+                    continue
+                future = pool.submit(fetch_source, module, source)
+                futures[future] = (module, source)
+
+        for future in as_completed(futures):
+            module, source = futures[future]
+            results[(module, source)] = future.result()
+            print(f"fetched {source}: {module}")
+            if not (github_backend == "graphql" and source == "github"):
+                record(module, source)
+            emit_if_done(module)
+
+        if github_backend == "graphql":
+            fresh = {key: value for key, value in results.items() if key not in restored}
+            pull_github_pages_graphql(fresh, pool)
+            for module, source in fresh:
+                if source == "github":
+                    record(module, source)
+            for module in module_sources:
+                emit_if_done(module, final=True)
+
+    modules = {}
+    if not keep:
+        return modules
+
+    for module, sources in module_sources.items():
+        modules[module] = assemble_module(module, sources, results)
+
+    return modules
+
+
+# %%
+
+# levels of dependencies to expand from pypi requires_dist, 0 is off,
+# overwritten by CLI option
+transitive_depth = 0
+transitive_sources = ["stackoverflow", "pypi", "github"]
+max_dependency_paths = 10  # shortest "pulled in by" paths kept per dependency
+
+
+def dependency_names(requires_dist: list) -> list:
+    """Which requirements a plain install pulls in. Optional extras, and
+    markers not matching target_python (or this interpreter), are dropped.
+    Input: pypi info requires_dist, list of requirement strings or None
+    Output: list of canonical distribution names, e.g. typing-extensions
+    """
+    if Requirement is None or not requires_dist:
+        return []
+
+    environment = {"extra": ""}
+    if target_python is not None:
+        environment["python_version"] = ".".join(str(part) for part in target_python)
+        environment["python_full_version"] = f"{environment['python_version']}.0"
+
+    names = []
+    for text in requires_dist:
+        try:
+            requirement = Requirement(text)
+        except InvalidRequirement:
+            continue
+        if requirement.marker is not None and not requirement.marker.evaluate(environment):
+            continue
+        names.append(canonicalize_name(requirement.name))
+
+    return list(dict.fromkeys(names))
+
+
+def pull_pypi_requires(package: str, sess: requests.Session=None) -> list:
+    """Memoized, so packages already looked up on pypi cost no request.
+    Input: package name
+    Output: list of distribution names it depends on
+    """
+    sess = sess or get_http_client()
+    response, data = run_memo.get_json(sess, f"https://pypi.org/pypi/{package}/json")
+    if data is None:
+        return []
+
+    return dependency_names((data.get("info") or {}).get("requires_dist"))
+
+
+def fetch_transitive(module_sources: dict, on_module=None, checkpoint=None, keep: bool=True) -> dict:
+    """Expands direct dependencies into their transitive closure, breadth
+    first. Each level's new packages are looked up together by
+    fetch_modules, so concurrency stays bounded by max_workers and
+    max_per_host, and a package shared by many dependents is visited once.
+
+    Input: dict of direct module name -> list of sources, as given to
+        fetch_modules. Only modules looked up on pypi are expanded.
+        on_module, checkpoint and keep as for fetch_modules
+    Output: dict of dependency name -> pulled content, empty with keep=False, plus
+        dependency_depth: 1 for a dependency of a direct module, and so on
+        dependency_required_by: every looked up module depending on it
+        dependency_paths: shortest paths from a direct module to it
+    """
+    if Requirement is None:
+        raise SystemExit("--transitive_depth needs packaging, pip install packaging")
+
+    # keyed by canonical name, so typing_extensions and typing-extensions meet
+    depth = {canonicalize_name(module): 0 for module in module_sources}
+    paths = {canonicalize_name(module): [[module]] for module in module_sources}
+    required_by = {}
+    frontier = [module for module, sources in module_sources.items() if "pypi" in sources]
+
+    def with_dependency(module: str, content: dict) -> dict:
+        return {**content,
+                "dependency_depth": depth[module],
+                "dependency_required_by": required_by[module],
+                "dependency_paths": paths[module]}
+
+    emit = on_module and (lambda module, content: on_module(module, with_dependency(module, content)))
+
+    modules = {}
+    level = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while frontier and level < transitive_depth:
+            level += 1
+            # usually run_memo hits, but not for lookups restored by --resume
+            frontier_requires = pool.map(pull_pypi_requires, frontier)
+
+            found = []
+            for module, requires in zip(frontier, frontier_requires):
+                for dependency in requires:
+                    required_by.setdefault(dependency, []).append(module)
+                    if depth.setdefault(dependency, level) != level:
+                        continue  # reached at a shallower level, or a direct module
+                    if dependency not in paths:
+                        paths[dependency] = []
+                        found.append(dependency)
+                    for path in paths[canonicalize_name(module)]:
+                        if len(paths[dependency]) < max_dependency_paths:
+                            paths[dependency].append(path + [dependency])
+
+            print(f"dependency level {level}: {len(found)} new packages")
+            if not found:
+                break
+            pulled = fetch_modules({module: transitive_sources for module in found}, emit, checkpoint, keep)
+            for module, content in pulled.items():
+                modules[module] = with_dependency(module, content)
+            frontier = found
+
+    return modules
+
 
-        github_repo_info['github_api_status'] = "success"
+# %%
 
-        # json section: header ================================================
-        github_repo_info['github_package'] = f"{repo}"
-        github_repo_info['github_header'] = f"Info about {repo}"
 
-        key_parent = 'description'
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+def lookup_failed(content) -> bool:
+    """Input: one source's pulled content
+    Output: True if it, or any page nested in it, has a failed api status
+    """
+    if isinstance(content, dict):
+        for key, value in content.items():
+            if key.endswith("_api_status") and value == "fail":
+                return True
+            if lookup_failed(value):
+                return True
 
-        key_parent = "created_at"
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+    return False
 
-        # calc days since creation=============================================
-        delta = calc_delta_days(github_data.get(key_parent))
-        github_repo_info[f"github_{key_parent}_delta"] = delta
 
-        key_parent = "updated_at"  # string = 2021-04-03T22:01:26Z
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+class Checkpoint(object):
+    """Records each finished (module, source) lookup to an .ndjson file under
+    output/ as it lands, so an interrupted scan rerun with --resume only
+    repeats lookups that failed or never ran.
 
-        # calc days since update===============================================
-        delta = calc_delta_days(github_data.get(key_parent))
-        github_repo_info[f"github_{key_parent}_delta"] = delta
+    Lines look like {"module": "pandas", "source": "pypi", "content": {...}}.
+    Later lines for the same lookup replace earlier ones.
+    """
 
-        # watcher count
-        key_parent = "subscribers_count"
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+    def __init__(self, path: str, resume: bool=False):
+        self.path = path
+        self.results = {}
+        self.failed = set()
+        self.lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as stream:
+                for line in stream:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # cut short when the last run was killed
+                    if "source" not in entry:
+                        continue  # per-module done markers, from older checkpoints
+                    self.results[(entry["module"], entry["source"])] = entry["content"]
+            print(f"checkpoint {path}: {len(self.results)} lookups recorded")
+
+        self.file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def get(self, module: str, source: str):
+        """Output: recorded content for a lookup, None if missing or failed"""
+        content = self.results.get((module, source))
+        if content is None or lookup_failed(content):
+            return None
+
+        return content
+
+    def write(self, entry: dict):
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()  # survives the process being killed
+
+    def record(self, module: str, source: str, content):
+        if lookup_failed(content):
+            self.failed.add((module, source))
+        else:
+            self.failed.discard((module, source))
+        self.write({"module": module, "source": source, "content": content})
+
+    def close(self):
+        """Closes the file, deleting it once nothing is left to retry."""
+        with self.lock:
+            self.file.close()
+        if self.failed:
+            print(f"{len(self.failed)} lookups failed, rerun with --resume to retry them")
+        else:
+            os.remove(self.path)
+
+
+# record lookups for --resume, overwritten by CLI options at startup
+resume_scans = False
+
+
+def open_checkpoint(name: str) -> Checkpoint:
+    """Input: output file prefix, e.g. local_script_imports
+    Output: Checkpoint under output/, continuing the last one with --resume
+    """
+    return Checkpoint(os.path.join(dir_py, "output", f"{name}_checkpoint.ndjson"), resume_scans)
 
-        # user show of support
-        key_parent = "stargazers_count"
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
 
-		# open_issues_count = issues + pull requests
-        key_parent = "has_issues"
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+# %%
 
-        key_parent = "open_issues_count"
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
 
-        key_parent = "open_issues"  # repeat?
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+# json or ndjson, overwritten by CLI options at startup
+output_format = "json"
 
-        key_parent = "has_projects"
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
 
-        key_parent = "has_downloads"
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+class NdjsonWriter(object):
+    """Appends one json record per module to an .ndjson file as lookups
+    finish, so a crash late in a run keeps everything fetched so far.
+    Records look like {"group": "pip_modules", "module": "pandas", "content": {...}}
+    and fold_ndjson turns a stream back into the nested json output.
+    """
 
-        key_parent = "has_wiki"
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+    def __init__(self, path: str, flush_every: int=20, flush_seconds: float=5):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.unflushed = 0
+        self.flushed_at = time.monotonic()
+
+    def write(self, group: str, module: str, content):
+        """Input: output group, e.g. pip_modules, module name, its content"""
+        record = json.dumps({"group": group, "module": module, "content": content})
+        with self.lock:
+            self.file.write(record + "\n")
+            self.unflushed += 1
+            if self.unflushed >= self.flush_every or time.monotonic() - self.flushed_at >= self.flush_seconds:
+                self.flush()
+
+    def writer_for(self, group: str):
+        """Output: on_module callback for fetch_modules, writing to one group"""
+        return lambda module, content: self.write(group, module, content)
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unflushed = 0
+        self.flushed_at = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.file.close()
+
+
+def open_output_stream(name: str):
+    """Input: output file prefix, e.g. local_script_imports
+    Output: NdjsonWriter in ndjson output mode, else None
+    """
+    if output_format != "ndjson":
+        return None
 
-        key_parent = "allow_forking"
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+    return NdjsonWriter(os.path.join(dir_py, "output", f"{name}_{right_now}.ndjson"))
 
-        key_parent = "fork"
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
 
-        key_parent = "forks_count"
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+def fold_ndjson(path_ndjson: str) -> dict:
+    """Folds an .ndjson stream back into the nested json output format and
+    writes it next to the stream. Later records for a module replace earlier
+    ones, and a line cut short by a crash is skipped.
+    Input: path to .ndjson file
+    Output: dict of group -> module -> content
+    """
+    all_modules = {"conda_modules": {}, "pip_modules": {}}
+    with open(path_ndjson, "r", encoding="utf-8") as stream:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"skipping unreadable line {line_number} in {path_ndjson}")
+                continue
+            all_modules.setdefault(record["group"], {})[record["module"]] = record["content"]
 
-        key_parent = "forks"  # repeat?
-        github_repo_info[f"github_{key_parent}"] = github_data.get(key_parent)
+    file = json.dumps(all_modules, indent=4)
+    with open(os.path.splitext(path_ndjson)[0] + ".json", "w") as outfile:
+        outfile.write(file)
 
-        # request count(commits). Limit set to 30 max
-        query_url = f"https://api.github.com/repos/{owner}/{repo}/commits"
-        response = sess.get(query_url, auth=token_in_env(True))
-        
-        if response.status_code == 200:  # success
-            github_data = response.json()
+    return all_modules
 
-            commit_count = 0
-            for each in github_data:
-                for k in each.keys():  # dont need values() or items()
-                    if k == "commit":
-                        commit_count += 1
 
-            key_parent = "commits_max_30"
-            github_repo_info[f"github_{key_parent}"] = commit_count
+# %%
 
-    return github_repo_info
 
+# write parquet and sqlite tables next to json output, overwritten by CLI options at startup
+export_tables = False
 
-# %%
+# a module's github pages, most to least likely to be its own repo
+github_page_preference = ["github_page_pypi_condaforge",
+                          "github_page_pypi",
+                          "github_page_condaforge",
+                          "github_page_condaforge_repo",  # the feedstock
+                          ]
 
+# columns dashboards filter and sort on
+export_indexes = ["module",
+                  "github_stargazers_count",
+                  "github_updated_at",
+                  "github_commits_last_90_days",
+                  "stackoverflow_count",
+                  ]
 
-def pull_stackoverflow_content(package: str) -> dict:
-    """Pull package info using Stackoverflow API.
-    API limit is 300 requests/day. OAuth registration requires a domain.
-    Example endpoint:
-    https://api.stackexchange.com/2.3/packages/{package}/info?site=stackoverflow
-    https://stackoverflow.com/questions/packages/{package}
 
-    Input: library name as string
-    Output: dict of stackoverflow stats
+def flatten_module(group: str, module: str, content) -> dict:
+    """Flattens one module's nested results into a single row. Of several
+    github pages, the module's own repo is kept, named in github_page.
+    Input: output group, e.g. pip_modules, module name, its content
+    Output: dict of column -> value
+    """
+    row = {"group": group, "module": module}
+    if not isinstance(content, dict):  # yml entries with unexpected formatting
+        row["note"] = str(content)
+        return row
+
+    for key, value in content.items():
+        if key == "pypi" and isinstance(value, dict):
+            row.update(value.get("pypi", {}))
+        elif key == "condaforge" and isinstance(value, dict):
+            row.update(value)
+        elif key == "github" and isinstance(value, dict):
+            pages = [page for page, page_info in value.items()
+                     if page.startswith("github_page") and isinstance(page_info, dict)]
+            pages = [page for page in github_page_preference if page in pages] \
+                    + [page for page in pages if page not in github_page_preference]
+            # plain keys, e.g. github_api_status when the lookup itself failed
+            row.update({name: page_info for name, page_info in value.items() if not isinstance(page_info, dict)})
+            if pages:
+                row["github_page"] = pages[0]
+                row.update(value[pages[0]])
+        else:
+            row[key] = value
+
+    return row
+
+
+def column_type(values: list) -> str:
+    """Input: one column's values
+    Output: bool, int, float or str, the narrowest type holding all values
+    """
+    types = {type(value) for value in values if value is not None}
+    if not types or types - {bool, int, float}:
+        return "str"
+    if types == {bool}:
+        return "bool"
+    if types <= {int, bool} and bool not in types:
+        return "int"
+    if types <= {int, float}:
+        return "float"
+    return "str"
+
+
+def to_columns(all_modules: dict) -> dict:
+    """Input: dict of group -> module -> content, as written to output/*.json
+    Output: dict of column -> (type, list of values), one value per module
+    """
+    rows = [flatten_module(group, module, content)
+            for group, modules in all_modules.items()
+            for module, content in modules.items()]
+
+    names = list(dict.fromkeys(key for row in rows for key in row))
+    columns = {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        kind = column_type(values)
+        if kind == "str":  # lists, dicts and mixed columns go in as text
+            values = [value if value is None or isinstance(value, str) else json.dumps(value)
+                      for value in values]
+        elif kind == "float":
+            values = [None if value is None else float(value) for value in values]
+        columns[name] = (kind, values)
+
+    return columns
+
+
+def write_sqlite_table(columns: dict, path: str):
+    """Writes columns as one indexed `modules` table, replacing the file.
+    Input: output of to_columns, path to .sqlite file
     """
+    sqlite_types = {"bool": "INTEGER", "int": "INTEGER", "float": "REAL", "str": "TEXT"}
+    if os.path.exists(path):
+        os.remove(path)
 
-    package = package  # search SO for package name as package
-    query_url = f"https://api.stackexchange.com/2.3/tags?inname={package}&site=stackoverflow"
-    sess = requests.Session()
-    response = sess.get(query_url, stream=True)  # stream until website found
+    conn = sqlite3.connect(path)
+    names = list(columns)
+    definitions = ", ".join(f'"{name}" {sqlite_types[kind]}' for name, (kind, values) in columns.items())
+    conn.execute(f'CREATE TABLE modules ({definitions}, PRIMARY KEY ("group", "module"))')
 
-    package_info = {}
-    # json section: header ================================================
-    package_info['stackoverflow_package'] = f"{package}"
+    rows = zip(*(values for kind, values in columns.values()))
+    placeholders = ", ".join("?" for name in names)
+    conn.executemany(f"INSERT OR REPLACE INTO modules VALUES ({placeholders})", rows)
 
-    # ensure request succeeds
-    if response.status_code != 200:  #  request failed
-        package_info['stackoverflow_api_status'] = "fail"
+    for name in export_indexes:
+        if name in columns:
+            conn.execute(f'CREATE INDEX "idx_{name}" ON modules ("{name}")')
 
-    else:  # request succeeded
-        try:
-            data = response.json()
-            data = data['items'][0]  # items contains a list of length 1!
-            package_info['stackoverflow_api_status'] = "success"
+    conn.commit()
+    conn.close()
 
-            package_info['stackoverflow_api_call'] = query_url
 
-            key_parent = 'name'
-            package_info[f"stackoverflow_{key_parent}"] = data.get(key_parent)
+def write_parquet_table(columns: dict, path: str):
+    """Writes columns to a .parquet file, if pyarrow is installed.
+    Input: output of to_columns, path to .parquet file
+    """
+    try:
+        import pyarrow  # pip install pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        print("pyarrow not installed, skipping parquet export")
+        return
+
+    arrow_types = {"bool": pyarrow.bool_(), "int": pyarrow.int64(), "float": pyarrow.float64(), "str": pyarrow.string()}
+    table = pyarrow.table({name: pyarrow.array(values, type=arrow_types[kind])
+                           for name, (kind, values) in columns.items()})
+    pyarrow.parquet.write_table(table, path)
+
+
+def export_modules(all_modules: dict, path_base: str):
+    """Exports results as typed columnar tables, one row per module:
+    {path_base}.sqlite always, {path_base}.parquet when pyarrow is available.
+    Input: dict of group -> module -> content, output path without extension
+    """
+    columns = to_columns(all_modules)
+    if not columns:
+        print(f"no modules to export to {path_base}")
+        return
 
-            key_parent = 'has_synonyms'
-            package_info[f"stackoverflow_{key_parent}"] = data.get(key_parent)
+    write_sqlite_table(columns, path_base + ".sqlite")
+    write_parquet_table(columns, path_base + ".parquet")
+    print(f"exported {len(columns.get('module', ('str', []))[1])} modules to {path_base}")
 
-            key_parent = 'count'
-            package_info[f"stackoverflow_{key_parent}"] = data.get(key_parent)
 
-        except IndexError:
-            package_info['stackoverflow_api_status'] = "stackoverflow package returned no results"
+def module_tables(all_modules: dict) -> dict:
+    """Of an --source all result, only the per-package groups are tables of
+    modules. files, scripts and yaml are keyed by path and source.
+    Input: dict as written to output/*.json
+    Output: dict of group -> module -> content
+    """
+    if "packages" not in all_modules:
+        return all_modules
 
-    return package_info
+    return {group: all_modules[group] for group in ("packages", "transitive_modules") if group in all_modules}
 
 
-def pull_pypi_content(package: str) -> dict:
-    """Given a package name, function queries pypi repo for selected fields.
-    Pypi repo typically contains the official dev site for each package. This
-    site is read in, and if it links to a Github page, the function then
-    queries Github API.
+def export_file(path_output: str):
+    """Exports an existing .json or .ndjson output file.
+    Input: path to output file
     """
+    if path_output.endswith(".ndjson"):
+        all_modules = fold_ndjson(path_output)
+    else:
+        with open(path_output, "r") as stream:
+            all_modules = json.load(stream)
 
-    pypi_results = {}
+    export_modules(module_tables(all_modules), os.path.splitext(path_output)[0])
 
-    query_url = f"https://pypi.org/pypi/{package}/json"
-    sess = requests.Session()
-    response = sess.get(query_url, stream=True)  # stream until website found
 
-    repo_info = {}
-    # json section: header ================================================
-    repo_info['pypi_package'] = f"{package}"
-    repo_info['pypi_header'] = f"Info about {package}"
+# %%
 
-    # ensure request succeeds
-    if response.status_code != 200:  #  request failed
-        repo_info['pypi_api_status'] = "fail"
 
-    else:  # request succeeded
-        data = response.json()
+# where installed package inventories are cached, overwritten by CLI options at startup
+inventory_dir = None
 
-        repo_info['pypi_api_status'] = "success"
+inventories = {}  # prefix -> (mtimes, packages), for this run
+inventories_lock = threading.Lock()
+inventory_format = 2  # bump when package fields change, so old cache files are re-read
 
-        # json section: info ==================================================
-        key_parent = 'info'
 
-        # Note: get() overcomes missing keys. For nested keys, use many gets
-        key_child = 'summary'
-        repo_info[f"pypi_{key_parent}_{key_child}"] = data.get(key_parent).get(key_child)
+def get_site_packages(prefix: str) -> list:
+    """Input: environment prefix, e.g. sys.prefix
+    Output: its site-packages directories
+    """
+    if os.path.abspath(prefix) == os.path.abspath(sys.prefix):
+        return [path for path in sys.path if os.path.isdir(path) and path.endswith("site-packages")]
 
-        key_child = 'requires_python'
-        repo_info[f"pypi_{key_parent}_{key_child}"] = data.get(key_parent).get(key_child)
+    site_dirs = [os.path.join(prefix, "Lib", "site-packages")]  # windows
+    lib = os.path.join(prefix, "lib")
+    if os.path.isdir(lib):
+        for entry in sorted(os.listdir(lib)):
+            if entry.startswith("python"):
+                site_dirs.append(os.path.join(lib, entry, "site-packages"))
 
-        key_child = 'requires_dist'
-        # repo_info[f"pypi_{key_parent}_{key_child}"] = data.get(key_parent).get(key_child)
-        repo_info[f"pypi_{key_parent}_{key_child}"] = str(data.get(key_parent).get(key_child))  # formatting variation
+    return [path for path in site_dirs if os.path.isdir(path)]
 
-        key_child = 'yanked'
-        repo_info[f"pypi_{key_parent}_{key_child}"] = data.get(key_parent).get(key_child)
 
-        # json section: vulnerabilities =======================================
-        key_parent = 'vulnerabilities'
-        repo_info[f"pypi_{key_parent}"] = data.get(key_parent)
+def inventory_mtimes(prefix: str) -> dict:
+    """Installing or removing a package adds or deletes an entry in these
+    directories, which moves their mtime.
+    Input: environment prefix
+    Output: dict of directory -> mtime_ns
+    """
+    dirs = get_site_packages(prefix) + [os.path.join(prefix, "conda-meta")]
 
-        # json section: info github============================================
-        key_parent = 'info'
+    return {path: os.stat(path).st_mtime_ns for path in dirs if os.path.isdir(path)}
 
-    pypi_results["pypi"] = repo_info
 
-    return pypi_results
+def read_installed_packages(prefix: str) -> dict:
+    """Reads every distribution in one pass, without shelling out to
+    `pip list`/`conda list`: .dist-info metadata via importlib.metadata, and
+    conda's conda-meta/*.json records, which win for conda installs.
+    top_level holds the import names a distribution provides, from
+    top_level.txt, else inferred from the files it installed.
+    Input: environment prefix
+    Output: dict of lowercase name -> {"name", "version", "installer", "top_level"}
+    """
+    packages = {}
+    for dist in importlib.metadata.distributions(path=get_site_packages(prefix)):
+        name = dist.metadata["Name"]
+        if not name or name.lower() in packages:
+            continue
+        installer = (dist.read_text("INSTALLER") or "unknown").strip().lower()
+
+        top_level = (dist.read_text("top_level.txt") or "").split()
+        if not top_level:
+            top_level = sorted({path.parts[0] if len(path.parts) > 1 else path.stem
+                                for path in dist.files or [] if path.suffix == ".py"})
+
+        packages[name.lower()] = {"name": name, "version": dist.version, "installer": installer,
+                                  "top_level": top_level}
+
+    conda_meta = os.path.join(prefix, "conda-meta")
+    if os.path.isdir(conda_meta):
+        for entry in os.scandir(conda_meta):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as file:
+                    record = json.load(file)
+            except (OSError, ValueError):
+                continue
+            package = packages.setdefault(record["name"].lower(), {"top_level": []})
+            package.update({"name": record["name"],
+                            "version": record.get("version"),
+                            "installer": "conda"})
+
+    return packages
+
+
+def get_installed_packages(prefix: str=None) -> dict:
+    """Installed package inventory for an environment, cached per prefix in
+    inventory_dir and reused until its package directories change.
+    Input: environment prefix, defaults to the running interpreter's
+    Output: dict of lowercase name -> {"name", "version", "installer", "top_level"}
+    """
+    prefix = os.path.abspath(prefix or sys.prefix)
+    mtimes = inventory_mtimes(prefix)
 
+    with inventories_lock:
+        if prefix in inventories and inventories[prefix][0] == mtimes:
+            return inventories[prefix][1]
 
-# %%
+    cache_path = None
+    if inventory_dir is not None:
+        digest = hashlib.blake2b(prefix.encode("utf-8"), digest_size=8).hexdigest()
+        cache_path = os.path.join(inventory_dir, f"inventory_{digest}.json")
+        try:
+            with open(cache_path, "r", encoding="utf-8") as file:
+                cached = json.load(file)
+            if cached.get("format") == inventory_format and cached["prefix"] == prefix \
+                    and cached["mtimes"] == mtimes:
+                with inventories_lock:
+                    inventories[prefix] = (mtimes, cached["packages"])
+                return cached["packages"]
+        except (OSError, ValueError, KeyError):
+            pass  # missing or stale
 
+    packages = read_installed_packages(prefix)
 
-def get_pip_list_modules() -> list:
-    """Function runs command line to determine which packages were installed
-    via `pip install {module}`
-    Output: list of modules
-    """
-    pip_list_modules = []
-    proc = subprocess.Popen('pip list', stdout=subprocess.PIPE, shell=True)
-    for line in io.TextIOWrapper(proc.stdout, encoding="utf-8"):
-        line = line.split()[0].strip().lower()  # get first column, strip spaces
-        pip_list_modules.append(line)
+    if cache_path is not None:
+        os.makedirs(inventory_dir, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as file:
+            json.dump({"format": inventory_format, "prefix": prefix, "mtimes": mtimes, "packages": packages}, file)
 
-    pip_list_modules = pip_list_modules[2:]  # drop header lines
-    pip_list_modules = list(set(pip_list_modules))
+    with inventories_lock:
+        inventories[prefix] = (mtimes, packages)
 
-    return pip_list_modules
+    return packages
 
 
-def get_conda_list_modules() -> list:
-    """Function runs command line to determine which packages were installed
-    via `conda install {module}`
+def get_pip_list_modules(prefix: str=None) -> list:
+    """Determine which packages were installed via `pip install {module}`,
+    or any other installer but conda.
+    Input: environment prefix, defaults to the running interpreter's
     Output: list of modules
     """
-    conda_list_modules = []
-    proc = subprocess.Popen('conda list', stdout=subprocess.PIPE, shell=True)
-    for line in io.TextIOWrapper(proc.stdout, encoding="utf-8"):
-        line = line.split()[0].strip().lower()  # get first column, strip spaces
-        conda_list_modules.append(line)
+    packages = get_installed_packages(prefix)
+
+    return [name for name, package in packages.items() if package["installer"] != "conda"]
+
 
-    conda_list_modules = conda_list_modules[3:]  # drop header lines
-    conda_list_modules = list(set(conda_list_modules))
+def get_conda_list_modules(prefix: str=None) -> list:
+    """Determine which packages were installed via `conda install {module}`
+    Input: environment prefix, defaults to the running interpreter's
+    Output: list of modules
+    """
+    packages = get_installed_packages(prefix)
 
-    return conda_list_modules
+    return [name for name, package in packages.items() if package["installer"] == "conda"]
 
 
 def get_standard_libraries(attempt_reading_libs=False) -> list:
@@ -555,183 +2735,993 @@ def get_standard_libraries(attempt_reading_libs=False) -> list:
 # %%
 
 
-def get_script_names(dir_py: str) -> list:
+# directories never worth scanning, on top of .gitignore rules
+skip_dirs = {".git", ".hg", ".svn", ".tox", ".nox", ".eggs", ".venv", "venv",
+             "site-packages", "node_modules", "__pycache__", "build", "dist",
+             ".mypy_cache", ".pytest_cache", ".ipynb_checkpoints",
+             }
+
+
+def read_ignore_file(dirpath: str) -> list:
+    """Read a .gitignore in dirpath, if any.
+    Input: directory
+    Output: list of rules as (base dir, pattern, negate, dir_only, anchored) tuples
+    """
+    rules = []
+    try:
+        with open(os.path.join(dirpath, ".gitignore"), "r", encoding="utf-8", errors="replace") as file:
+            for line in file:
+                pattern = line.rstrip("\n").rstrip()
+                if not pattern or pattern.startswith("#"):
+                    continue
+
+                negate = pattern.startswith("!")
+                pattern = pattern.lstrip("!")
+                dir_only = pattern.endswith("/")  # build/
+                pattern = pattern.rstrip("/")
+                anchored = "/" in pattern  # /build or docs/build
+                pattern = pattern.lstrip("/")
+                rules.append((dirpath, pattern, negate, dir_only, anchored))
+
+    except OSError:  # no .gitignore here
+        pass
+
+    return rules
+
+
+ignore_regexes = {}  # anchored .gitignore pattern -> compiled regex
+
+
+def ignore_pattern_regex(pattern: str):
+    """Translate an anchored .gitignore pattern. Unlike fnmatch, `*` and `?`
+    don't cross `/`, a `**/` segment matches zero or more directories and a
+    trailing `/**` everything inside.
+    Input: pattern, e.g. docs/**/build
+    Output: compiled regex, to fullmatch against a relative path
+    """
+    regex = ignore_regexes.get(pattern)
+    if regex is not None:
+        return regex
+
+    parts = pattern.split("/")
+    translated = ""
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        if part == "**":
+            translated += ".*" if last else "(?:[^/]*/)*"
+            continue
+
+        j = 0
+        while j < len(part):
+            char = part[j]
+            if char == "*":
+                translated += "[^/]*"
+            elif char == "?":
+                translated += "[^/]"
+            elif char == "\\" and j + 1 < len(part):
+                j += 1
+                translated += re.escape(part[j])
+            elif char == "[" and "]" in part[j + 2:]:  # [abc], [!abc], []]
+                end = part.index("]", j + 2)
+                members = part[j + 1:end]
+                if members.startswith("!"):
+                    members = "^" + members[1:]
+                translated += "[" + members.replace("\\", "\\\\") + "]"
+                j = end
+            else:
+                translated += re.escape(char)
+            j += 1
+
+        if not last:
+            translated += "/"
+
+    regex = re.compile(translated)
+    ignore_regexes[pattern] = regex
+
+    return regex
+
+
+def is_ignored(path: str, is_dir: bool, rules: list) -> bool:
+    """Apply .gitignore-style rules in order, last match wins.
+    Patterns without a slash match the name at any depth, patterns with one
+    match the path relative to their .gitignore's directory.
+    Input: path, whether it's a directory, rules from read_ignore_file
+    Output: True if path should be skipped
+    """
+    ignored = False
+    name = os.path.basename(path)
+    for base, pattern, negate, dir_only, anchored in rules:
+        if dir_only and not is_dir:
+            continue
+
+        if anchored:
+            relative = os.path.relpath(path, base).replace(os.sep, "/")
+            matched = ignore_pattern_regex(pattern).fullmatch(relative) is not None
+        else:
+            matched = fnmatch.fnmatchcase(name, pattern)
+
+        if matched:
+            ignored = not negate
+
+    return ignored
+
+
+def walk_files(root: str, extensions: tuple, rules: list=None):
+    """Recursively yield files under root, one at a time. Skips skip_dirs,
+    virtual environments (any dir holding pyvenv.cfg), *.egg-info and
+    anything matched by a .gitignore on the way down.
+    Input: root directory, file extensions e.g. ('.py',), inherited rules
+    Output: generator of filepaths
+    """
+    rules = (rules or []) + read_ignore_file(root)
+    try:
+        entries = os.scandir(root)
+    except OSError as error:
+        print(f"cannot read directory {root}: {error}")
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name in skip_dirs \
+                        or entry.name.endswith(".egg-info") \
+                        or os.path.exists(os.path.join(entry.path, "pyvenv.cfg")) \
+                        or is_ignored(entry.path, True, rules):
+                    continue
+                yield from walk_files(entry.path, extensions, rules)
+
+            elif entry.name.endswith(extensions) and not is_ignored(entry.path, False, rules):
+                yield entry.path
+
+
+# input dirs, overwritten by CLI options at startup
+input_py_dirs = [os.path.join(dir_py, "input_py")]
+input_yml_dirs = [os.path.join(dir_py, "input_yml")]
+
+
+def get_script_names(dir_scripts: str, filepaths: list=None) -> list:
     """
     Create list of .py modules found in input directory.
     
     Because .py modules may import functionality from personally created
     modules located in the same directory, these filenames should be excluded
     from API qeuries. That is, if you wrote helper.py module and 
-    `import helper`, then this would be excluded from API queries.
+    `import helper`, then this would be excluded from API queries. Directory
+    names under the input dir count too, since they are local packages.
     
-    Input: string directory of where your working project modules are.
+    Input: string directory of where your working project modules are,
+        optionally the .py filepaths already found there.
     Output: 
-        list of filenames, without file extensions.
+        list of module names, without file extensions.
+    """
+
+    if filepaths is None:
+        filepaths = walk_files(dir_scripts, ('.py',))
+
+    filenames = set()
+    for filepath in filepaths:
+        relative = os.path.relpath(filepath, dir_scripts)
+        parts = relative.split(os.sep)
+        filenames.update(parts[:-1])  # package directories
+        if parts[-1] != "__init__.py":
+            filenames.add(parts[-1][:-len(".py")])
+
+    return list(filenames)
+
+
+# %%
+
+# top-level stdlib modules added/removed per python version, used to shift
+# the running interpreter's stdlib names to a different target version
+stdlib_changes = {(3, 9): {"added": ["graphlib", "zoneinfo"]},
+                  (3, 10): {"removed": ["formatter", "parser", "symbol"]},
+                  (3, 11): {"added": ["tomllib"], "removed": ["binhex"]},
+                  (3, 12): {"removed": ["asynchat", "asyncore", "distutils", "imp", "smtpd"]},
+                  (3, 13): {"removed": ["aifc", "audioop", "cgi", "cgitb", "chunk", "crypt",
+                                       "imghdr", "lib2to3", "mailcap", "msilib", "nis",
+                                       "nntplib", "ossaudiodev", "pipes", "sndhdr", "spwd",
+                                       "sunau", "telnetlib", "uu", "xdrlib"]},
+                  (3, 14): {"added": ["annotationlib", "compression"]},
+                  }
+
+
+def get_stdlib_names(target_version: tuple=None) -> set:
+    """Standard library names for a target python version. Starts from
+    sys.stdlib_module_names (python 3.10+), or the hardcoded 3.9 list on older
+    interpreters, then applies stdlib_changes between the running and target
+    versions.
+    Input: target version, e.g. (3, 8). Defaults to the running version
+    Output: set of lowercase top-level module names
+    """
+    if hasattr(sys, "stdlib_module_names"):
+        base_version = sys.version_info[:2]
+        names = set(sys.stdlib_module_names)
+    else:
+        base_version = (3, 9)
+        names = set(get_standard_libraries())
+
+    names = {name.strip().lower() for name in names}
+    target_version = tuple(target_version or base_version)
+
+    for version, changes in stdlib_changes.items():
+        if base_version < version <= target_version:  # step forward
+            names.update(changes.get("added", []))
+            names.difference_update(changes.get("removed", []))
+        elif target_version < version <= base_version:  # step back
+            names.difference_update(changes.get("added", []))
+            names.update(changes.get("removed", []))
+
+    return names
+
+
+# bundled import name -> distribution name table, plus any --import_names files,
+# overwritten by CLI options at startup. Later files win.
+import_names_files = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_names.json")]
+
+# look up imports which resolve to no distribution under their import name,
+# e.g. numpy when scanning from another environment, overwritten by CLI option.
+# These go under unresolved_modules with their results, so the guesses show
+fetch_unresolved = True
+
+# environment prefix imports are resolved against, overwritten by CLI option
+scan_prefix = None
+
+
+def load_import_names(paths: list) -> dict:
+    """Input: list of json files mapping import name -> distribution name
+    Output: merged dict, with lowercase import names
+    """
+    import_names = {}
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                table = json.load(file)
+        except (OSError, ValueError) as error:
+            print(f"could not read import names from {path}: {error}")
+            continue
+        import_names.update({name.lower(): dist.lower() for name, dist in table.items()})
+
+    return import_names
+
+
+def get_import_distributions(prefix: str=None) -> dict:
+    """Like importlib.metadata.packages_distributions(), for any environment,
+    from the cached installed package inventory.
+    Input: environment prefix, defaults to the running interpreter's
+    Output: dict of lowercase import name -> list of lowercase distribution names
     """
+    import_dists = {}
+    for name, package in get_installed_packages(prefix).items():
+        for module in package["top_level"]:
+            dists = import_dists.setdefault(module.lower(), [])
+            if name not in dists:
+                dists.append(name)
+
+    return import_dists
 
-    dir_scripts = os.path.join(dir_py, "input_py")
 
-    filenames = []
-    for file in os.listdir(dir_scripts):
-        if file.endswith('.py'):
-            filenames.append(file.replace(".py", ""))
+class ModuleIndex(object):
+    """Module name lookups built once per run, so the import loop does
+    hashed set lookups instead of rebuilding and scanning lists per line.
 
-    return filenames
+    stdlib: standard library names for the target python version
+    local: .py modules in the input directory being scanned, see set_local
+    installed: import name -> distributions installed here which provide it
+    import_names: bundled import name -> distribution name table
+    """
+
+    def __init__(self, target_version: tuple=None):
+        self.stdlib = get_stdlib_names(target_version)
+        self.local = set()
+        self.installed = get_import_distributions(scan_prefix)
+        self.import_names = load_import_names(import_names_files)
+
+    def set_local(self, dir_scripts: str, filepaths: list=None):
+        """Only local modules differ between input directories, so the rest
+        is built once however many are scanned.
+        Input: input directory, optionally the .py filepaths already found there
+        """
+        self.local = {name.lower() for name in get_script_names(dir_scripts, filepaths)}
+
+    def classify(self, name: str) -> str:
+        """Input: top-level module name
+        Output: "stdlib", "local" or "third-party"
+        """
+        if name in self.stdlib:
+            return "stdlib"
+        if name in self.local:
+            return "local"
+
+        return "third-party"
+
+    def resolve(self, name: str) -> str:
+        """Distribution to query for an import, e.g. sklearn -> scikit-learn.
+        Installed metadata wins, the bundled table covers the rest.
+        Input: top-level module name
+        Output: distribution name, or None if it can't be resolved
+        """
+        name = name.lower()
+        dists = self.installed.get(name, [])
+        if len(dists) == 1:
+            return dists[0]
+        if name in self.import_names:  # also settles namespace packages
+            return self.import_names[name]
+        if dists:
+            return sorted(dists)[0]
+
+        return None
+
+
+# target python version for stdlib filtering, overwritten by CLI option
+target_python = None
 
 
 # %%
 
+# below this many files, process startup costs more than parsing in-process
+parse_processes_threshold = 64
+parse_processes = None  # None = one per cpu
 
-def get_script_imports(dir_py: str) -> dict:
+
+def normalize_module_name(name: str) -> str:
+    """Input: dotted import name, e.g. sqlalchemy.orm
+    Output: top-level module name, e.g. sqlalchemy
     """
-    Scans all files in input directory and creates a list of all imported
-    modules. Removed standard library and local module .py imports from result.
-    
-    It then checks each module to see if it was installed via conda or pip,
-    then makes respective API requests.
-    
-    It also writes results to a .json file in ouput dir.
-    
-    Input: string directory of where your working project modules are.
-    Output: dict of API requests
+    return name.split('.')[0].strip().lower()
+
+
+def extract_imports_ast(source: bytes) -> list:
+    """Walk the syntax tree for import statements. Comments, strings and
+    docstrings mentioning `import` are ignored. Relative imports are skipped,
+    since they always point at local modules.
+    Input: file contents
+    Output: list of top-level module names, in order of first appearance
+    """
+    modules = []
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            for alias in node.names:  # import a, b.c as d
+                modules.append(normalize_module_name(alias.name))
+
+        elif isinstance(node, ast.ImportFrom):
+            if node.level == 0 and node.module:  # from a.b import c
+                modules.append(normalize_module_name(node.module))
+
+    return list(dict.fromkeys(modules))
+
+
+def extract_imports_tokenize(source: bytes) -> list:
+    """Fallback for files ast can't parse (python 2, syntax errors). Reads
+    `import x, y` and `from x import y` token by token at the start of each
+    logical line, and keeps whatever was found before any tokenizer error.
+    Input: file contents
+    Output: list of top-level module names, in order of first appearance
+    """
+    modules = []
+    statement = []  # tokens of the current logical line
+    try:
+        for token in tokenize.tokenize(io.BytesIO(source).readline):
+            if token.type in (tokenize.NEWLINE, tokenize.ENDMARKER):
+                modules.extend(read_import_statement(statement))
+                statement = []
+            elif token.type in (tokenize.NAME, tokenize.OP):
+                statement.append(token.string)
+    except (tokenize.TokenError, SyntaxError, UnicodeDecodeError):
+        pass
+
+    return list(dict.fromkeys(modules))
+
+
+def read_import_statement(tokens: list) -> list:
+    """Input: NAME/OP token strings of one logical line
+    Output: list of top-level module names the line imports
+    """
+    if tokens[:1] == ["import"]:
+        modules = []
+        expect_name = True
+        for token in tokens[1:]:
+            if expect_name and token.isidentifier():
+                modules.append(normalize_module_name(token))
+                expect_name = False
+            elif token == ",":
+                expect_name = True
+        return modules
+
+    if tokens[:1] == ["from"] and len(tokens) > 1 and tokens[1].isidentifier():
+        return [normalize_module_name(tokens[1])]  # relative imports start with "."
+
+    return []
+
+
+def extract_imports(filepath: str) -> list:
+    """Input: path to a .py file
+    Output: list of top-level module names imported by the file, empty if
+        it can't be read
+    """
+    try:
+        with open(filepath, "rb") as file:  # bytes, so ast honors encoding cookies
+            source = file.read()
+    except OSError as error:
+        print(f"cannot read file, skipping: {error}")
+        return []
+
+    try:
+        return extract_imports_ast(source)
+    except (SyntaxError, ValueError,  # ValueError: null bytes
+            RecursionError, MemoryError):  # deeply nested, e.g. generated code
+        print(f"ast parse failed, tokenizing instead: {filepath}")
+        return extract_imports_tokenize(source)
+
+
+def extract_imports_many(filepaths: list) -> dict:
+    """Parse many files, spreading them over a process pool for large trees.
+    Input: list of .py filepaths
+    Output: dict of filepath -> list of imported module names, in input order
+    """
+    if len(filepaths) < parse_processes_threshold:
+        return {filepath: extract_imports(filepath) for filepath in filepaths}
+
+    workers = parse_processes or os.cpu_count() or 1
+    chunksize = max(1, min(256, len(filepaths) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        file_imports = pool.map(extract_imports, filepaths, chunksize=chunksize)
+        return dict(zip(filepaths, file_imports))
+
+
+class ScanIndex(object):
+    """SQLite index of every scanned .py file: size, mtime, content hash and
+    extracted imports. A file is only re-read when its size or mtime moved,
+    and only re-parsed when its content hash changed too, so a rescan of an
+    unchanged tree costs one stat per file.
+    """
+
+    def __init__(self, cache_dir: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "scan_index.sqlite"))
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                                 path TEXT PRIMARY KEY,
+                                 size INTEGER,
+                                 mtime_ns INTEGER,
+                                 digest TEXT,
+                                 imports TEXT)""")
+        self.conn.commit()
+
+    def load(self) -> dict:
+        """Output: dict of path -> (size, mtime_ns, digest, imports list)"""
+        rows = self.conn.execute("SELECT path, size, mtime_ns, digest, imports FROM files")
+        return {path: (size, mtime_ns, digest, json.loads(imports))
+                for path, size, mtime_ns, digest, imports in rows}
+
+    def save(self, entries: dict):
+        """Input: dict of path -> (size, mtime_ns, digest, imports list)"""
+        self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                              [(path, size, mtime_ns, digest, json.dumps(imports))
+                               for path, (size, mtime_ns, digest, imports) in entries.items()])
+        self.conn.commit()
+
+
+# file index, created at startup unless --no_cache is set
+scan_index = None
+
+
+def hash_file(filepath: str) -> str:
+    """Input: path to file
+    Output: hex digest of file contents
+    """
+    with open(filepath, "rb") as file:
+        return hashlib.blake2b(file.read(), digest_size=16).hexdigest()
+
+
+def extract_imports_indexed(filepaths: list, rescan: bool=False) -> dict:
+    """Like extract_imports_many, but reuses imports stored in scan_index for
+    files which haven't changed since the last scan.
+    Input: iterable of .py filepaths, e.g. from walk_files,
+        rescan=True to ignore stored imports
+    Output: dict of filepath -> list of imported module names, in input order
+    """
+    if scan_index is None:
+        return extract_imports_many(list(filepaths))
+
+    indexed = {} if rescan else scan_index.load()
+
+    file_imports = {}
+    changed = {}  # path -> (size, mtime_ns, digest), files needing a parse
+    updated = {}  # entries to write back
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+            entry = indexed.get(filepath)
+            if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                file_imports[filepath] = entry[3]  # untouched since last scan
+                continue
+
+            digest = hash_file(filepath)
+        except OSError as error:
+            print(f"cannot read file, skipping: {error}")
+            continue
+
+        if entry is not None and entry[2] == digest:  # touched, not edited
+            file_imports[filepath] = entry[3]
+            updated[filepath] = (stat.st_size, stat.st_mtime_ns, digest, entry[3])
+        else:
+            file_imports[filepath] = None  # placeholder keeps input order
+            changed[filepath] = (stat.st_size, stat.st_mtime_ns, digest)
+
+    print(f"scan index: {len(file_imports) - len(changed)} files reused, {len(changed)} parsed")
+
+    for filepath, imports in extract_imports_many(list(changed)).items():
+        file_imports[filepath] = imports
+        updated[filepath] = changed[filepath] + (imports,)
+
+    scan_index.save(updated)
+
+    return file_imports
+
+
+# %%
+
+# canonical name -> the name a package was first listed under, so a package
+# spelt typing_extensions in one place and typing-extensions in another is
+# one registry entry, looked up once
+registry_names = {}
+
+
+def registry_name(name: str) -> str:
+    """Input: distribution name, as listed or resolved
+    Output: the name the registry keys this package by
     """
+    return registry_names.setdefault(canonicalize_name(name), name)
+
+
+def collect_script_modules(dirs_scripts: list, rescan: bool=False) -> dict:
+    """Scans all .py files in the input directories and lists every imported
+    module, less standard library and local module .py imports, resolved to
+    the distribution to look up.
 
-    dir_scripts = os.path.join(dir_py, "input_py")
+    Input: list of directories of your working project modules,
+        rescan=True to re-parse files the scan index says are unchanged
+    Output: registry dict of
+        sources: group -> module -> list of sources to look up
+        notes: group -> module -> why it isn't looked up
+        files: filepath -> modules it references
+    """
 
     # get lists of installed modules
     # conda_list_modules = get_conda_list_modules()  # $ conda list
     # pip_list_modules = get_pip_list_modules()  # $ pip list
 
-    already_checked = []
-    conda_modules = {}
-    pip_modules = {}
+    conda_sources = {}
+    pip_sources = {}
+    unresolved_sources = {}  # looked up under the import name, a guess
+    unresolved_modules = {}
+    files = {}
+
+    module_index = ModuleIndex(target_python)
+    for dir_scripts in dirs_scripts:
+        file_imports = extract_imports_indexed(walk_files(dir_scripts, ('.py',)), rescan)
+        module_index.set_local(dir_scripts, file_imports.keys())
+
+        for filepath, modules in file_imports.items():
+            print(f"processing file: {os.path.relpath(filepath, dir_scripts)}")
+            files[filepath] = []
+            for module in modules:
+                if module_index.classify(module) != "third-party":
+                    continue
+
+                # query the distribution, not the import name, e.g. sklearn -> scikit-learn
+                dist = module_index.resolve(module)
+                if dist is None and fetch_unresolved:
+                    dist = registry_name(module)
+                    files[filepath].append(dist)
+                    if dist not in pip_sources and dist not in unresolved_sources:
+                        print(f"processing module: {module}, not installed, looked up under its import name")
+                        unresolved_sources[dist] = ["stackoverflow", "pypi", "github"]
+                    continue
+                if dist is None:
+                    unresolved_modules[module] = "Not installed and not in import name table, not looked up (--skip_unresolved)"
+                    files[filepath].append(module)
+                    continue
+
+                dist = registry_name(dist)
+                files[filepath].append(dist)
+                if dist in pip_sources or dist in conda_sources:
+                    continue
+                unresolved_sources.pop(dist, None)  # resolved after all, e.g. in another input dir
+                if dist != module:
+                    print(f"processing module: {module}, distribution {dist}")
+                else:
+                    print(f"processing module: {module}")
+                module = dist
+
+                # if module in conda_list_modules:
+                    # conda_sources[module] = ["stackoverflow"]
+
+                # elif module in pip_list_modules:
+                    # pip_sources[module] = ["stackoverflow", "pypi"]
+
+                # else:  # if module not conda or pip installed
+                pip_sources[module] = ["stackoverflow", "pypi", "github"]
+
+    if unresolved_sources:
+        print(f"looked up under their import name, no distribution found for: {', '.join(unresolved_sources)}")
+    if unresolved_modules:
+        print(f"not looked up, no distribution found for: {', '.join(unresolved_modules)}")
+
+    return {"sources": {"conda_modules": conda_sources, "pip_modules": pip_sources,
+                        "unresolved_modules": unresolved_sources},
+            "notes": {"unresolved_modules": unresolved_modules},
+            "files": files}
+
+
+def select_sources(content: dict, sources: list) -> dict:
+    """Input: module content from fetch_modules, sources wanted
+    Output: content of only those sources, in the same shape
+    """
+    return {key: value for key, value in content.items()
+            if key in sources or ("stackoverflow" in sources and key.startswith("stackoverflow_"))}
+
+
+def merge_sources(registries: list) -> dict:
+    """Input: list of registries from collect_script_modules/collect_yml_modules
+    Output: dict of module -> union of the sources any group wants for it,
+        in source_fetchers order
+    """
+    module_sources = {}
+    for registry in registries:
+        for sources in registry["sources"].values():
+            for module, module_source in sources.items():
+                module_sources.setdefault(module, set()).update(module_source)
+
+    return {module: [source for source in source_fetchers if source in sources]
+            for module, sources in module_sources.items()}
+
+
+def fan_out(registry: dict, packages: dict) -> dict:
+    """Splits merged results back into a registry's groups, each group
+    seeing only the sources it asked for.
+    Input: registry, dict of module -> pulled content from fetch_modules
+    Output: dict of group -> module -> pulled content or note
+    """
     all_modules = {}
-    for file in os.listdir(dir_scripts):
-        print(f"processing file: {file}")
-        if file.endswith('.py'):
-            filepath = os.path.join(dir_scripts, file)
-            lines = open(filepath, "r").readlines()
-
-            for line in lines:
-                if 'import' in line.casefold():
-                    module = line.split(' ')[1]
-                    module = module.strip().lower()
-                    # this handles `from sqlalchemy import a, from sqlalchemy import b`
-
-                    if module not in get_standard_libraries() \
-                            and module not in get_script_names(dir_py) \
-                            and module not in already_checked:
-                        already_checked.append(module)
-                        print(f"processing module: {module}")
-
-                        # if module in conda_list_modules:
-                            # conda_modules[module] = pull_stackoverflow_content(module)
-
-                        # elif module in pip_list_modules:
-                            # pip_modules[module] = pull_stackoverflow_content(module)
-                            # pip_modules[module]["pypi"] = pull_pypi_content(module)
-                            
-                        # else:  # if module not conda or pip installed
-                        pip_modules[module] = pull_stackoverflow_content(module)
-                        pip_modules[module]["pypi"] = pull_pypi_content(module)
-                        pip_modules[module]["github"] = find_github_pages(module)
-
-                        # get all homepages and make github endpoint calls
-                        for key, homepage in pip_modules[module]["github"].items():
-                            pip_modules[module]["github"][key] = pull_github_content(homepage)
-
-    all_modules["conda_modules"] = conda_modules
-    all_modules["pip_modules"] = pip_modules
-
-    # write to file
-    file = json.dumps(all_modules, indent=4)
-    with open(os.path.join(dir_py, "output", f"local_script_imports_{right_now}.json"), "w") as outfile:
-        outfile.write(file)
+    for group in dict.fromkeys(list(registry["sources"]) + list(registry["notes"])):
+        sources = registry["sources"].get(group, {})
+        all_modules[group] = {**{module: select_sources(packages[module], module_sources)
+                                 for module, module_sources in sources.items()},
+                              **registry["notes"].get(group, {})}
+
+    return all_modules
+
+
+def fetch_registry(registry: dict, name: str) -> dict:
+    """Runs every lookup in a registry, then writes results to a .json file
+    in output dir, or streams them with --output ndjson.
+    Input: registry from collect_script_modules/collect_yml_modules,
+        output file prefix
+    Output: dict of group -> module -> pulled content or note, empty if
+        streamed without --export
+    """
+    # every group's lookups go in one fetch_modules call, so all of them run
+    # concurrently once the full module list is known
+    module_sources = merge_sources([registry])
+    module_groups = {}
+    for group, sources in registry["sources"].items():
+        for module in sources:
+            module_groups.setdefault(module, []).append(group)
+
+    def on_module(module: str, content: dict):
+        for group in module_groups[module]:
+            stream.write(group, module, select_sources(content, registry["sources"][group][module]))
+
+    stream = open_output_stream(name)
+    checkpoint = open_checkpoint(name)
+    keep = not stream or export_tables  # streamed results are only kept for --export
+    all_modules = {}
+    try:
+        if stream:
+            for group, notes in registry["notes"].items():
+                for module, note in notes.items():
+                    stream.write(group, module, note)
+        packages = fetch_modules(module_sources, stream and on_module, checkpoint, keep)
+        if keep:
+            all_modules = fan_out(registry, packages)
+        if transitive_depth:
+            transitive = fetch_transitive(module_sources, stream and stream.writer_for("transitive_modules"), checkpoint, keep)
+            if keep:
+                all_modules["transitive_modules"] = transitive
+    finally:
+        if stream:
+            stream.close()
+
+    # write to file, streamed runs were written as they went
+    if not stream:
+        file = json.dumps(all_modules, indent=4)
+        with open(os.path.join(dir_py, "output", f"{name}_{right_now}.json"), "w") as outfile:
+            outfile.write(file)
+
+    if export_tables:
+        export_modules(all_modules, os.path.join(dir_py, "output", f"{name}_{right_now}"))
+
+    checkpoint.close()  # kept only if lookups are left to retry
 
     return all_modules
 
 
+def get_script_imports(dir_py: str, rescan: bool=False) -> dict:
+    """
+    Scans all files in input directories and creates a list of all imported
+    modules. Removed standard library and local module .py imports from result.
+    
+    It then checks each module to see if it was installed via conda or pip,
+    then makes respective API requests.
+    
+    It also writes results to a .json file in ouput dir.
+    
+    Input: string directory of where your working project modules are,
+        rescan=True to re-parse files the scan index says are unchanged
+    Output: dict of API requests
+    """
+    registry = collect_script_modules(input_py_dirs, rescan)
+
+    return fetch_registry(registry, "local_script_imports")
+
+
 # option added
 # local_script_imports = get_script_imports(dir_py)
 
 # %%
 
 
+# libyaml's C loader parses several times faster, when pyyaml was built with it
+yaml_loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def read_yml_env(filepath: str) -> dict:
+    """Reads the dependencies of one conda environment file.
+    Input: path to .yml/.yaml file
+    Output: dict of "conda" and "pip" module name lists, plus
+        "conda_unexpected" and "pip_unexpected" entries which can't be
+        looked up. None if the file isn't an environment file.
+    """
+    with open(filepath, "r") as stream:
+        yml_file = yaml.load(stream, Loader=yaml_loader)  # safe cannot execute code
+
+    # recursive walk also finds ci configs etc, skip non-env files
+    if not isinstance(yml_file, dict) or 'dependencies' not in yml_file:
+        return None
+
+    env = {"conda": [], "pip": [], "conda_unexpected": [], "pip_unexpected": [],
+           "conda_pins": {}, "pip_pins": {}}
+
+    # drill down into 'dependencies' yml block
+    dependencies = yml_file['dependencies']
+    for module in dependencies:
+
+        # each module is a string in this list
+        if isinstance(module, str):
+            parsed = parse_requirement(module, conda=True)
+            if "=" in module and parsed is not None:
+                env["conda"].append(parsed[0])
+                env["conda_pins"][parsed[0]] = module
+            elif "=" in module and Requirement is None:  # no packaging, names only
+                env["conda"].append(strip_conda_channel(module).split("=")[0].strip().lower())
+            elif "://" in module:  # http sites can happen
+                next
+            else:
+                env["conda_unexpected"].append(module)
+
+        # pip dependencies, are a nested dict
+        # this contains single element list, so drill down again
+        # then iterate through pip dependency lis
+        elif isinstance(module, dict) and 'pip' in module.keys():
+            for pip_module in module['pip']:
+                parsed = parse_requirement(pip_module)
+                if "=" in pip_module and parsed is not None:
+                    env["pip"].append(parsed[0])
+                    env["pip_pins"][parsed[0]] = pip_module
+                elif "=" in pip_module and Requirement is None:  # no packaging, names only
+                    env["pip"].append(pip_module.split("=")[0].strip().lower())
+                elif "://" in pip_module:  # http sites can happen
+                    next
+                else:
+                    env["pip_unexpected"].append(pip_module)
+
+    return env
+
+
+def collect_yml_modules(dirs_yml: list) -> dict:
+    """Reads yml/yaml conda environment files in the input directories, and
+    lists conda dependencies, followed by pip dependencies. A module in
+    several files is listed once. Pinned requirements go to module_pins.
+    Input: list of directories
+    Output: registry dict, as from collect_script_modules
+    """
+    conda_sources = {}
+    pip_sources = {}
+    conda_modules = {}  # entries which can't be looked up
+    pip_modules = {}
+    files = {}
+    for dir_yml in dirs_yml:
+        for filepath in walk_files(dir_yml, ('.yml', '.yaml')):
+            # TODO: or file == "requirements.txt":
+            env = read_yml_env(filepath)
+            if env is None:
+                continue
+
+            files[filepath] = list(dict.fromkeys(registry_name(module) for module in env["conda"] + env["pip"]))
+            for module in env["conda"]:
+                conda_sources[registry_name(module)] = ["stackoverflow"]
+                if conda_index is not None:
+                    conda_sources[registry_name(module)].append("condaforge")
+            for module in env["pip"]:
+                pip_sources[registry_name(module)] = ["stackoverflow", "pypi"]
+            for installer in ("conda", "pip"):
+                for module, requirement in env[f"{installer}_pins"].items():
+                    module_pins[installer].setdefault(registry_name(module), []).append(requirement)
+            for module in env["conda_unexpected"]:
+                conda_modules[module] = f"Unexpected formatting on {module}"
+            for module in env["pip_unexpected"]:
+                pip_modules[module] = f"Unexpected formatting on {module}"
+
+    return {"sources": {"conda_modules": conda_sources, "pip_modules": pip_sources},
+            "notes": {"conda_modules": conda_modules, "pip_modules": pip_modules},
+            "files": files}
+
+
 def get_yml_modules() -> dict:
-    """Reads yml/yaml conda environment files in a directory, and then does
-    API requests for conda dependencies, followed by pip dependencies.
+    """Reads yml/yaml conda environment files in the input directories, and
+    then does API requests for conda dependencies, followed by pip
+    dependencies.
     
     Output: dict of API requests
     It also writes results to a .json file in ouput dir.
     """
+    registry = collect_yml_modules(input_yml_dirs)
 
-    dir_yml = os.path.join(dir_py, "input_yml")
+    return fetch_registry(registry, "yml_env_modules")
 
-    all_modules = {}
-    conda_modules = {}
-    pip_modules = {}
-    for file in os.listdir(dir_yml):
-        if file.endswith('.yml') or file.endswith('.yaml'):
-            # TODO: or file == "requirements.txt":
-            filepath = os.path.join(dir_yml, file)
-            with open(filepath, "r") as stream:
-                yml_file = yaml.safe_load(stream)  # safe cannot execute code
-    
-                # drill down into 'dependencies' yml block
-                dependencies = yml_file['dependencies']
-                for module in dependencies:
-                    
-                    # each module is a string in this list
-                    if isinstance(module, str):
-                        if "=" in module:
-                            module = module.split("=")[0].strip().lower()
-                            conda_modules[module] = pull_stackoverflow_content(module)
-                        elif "://" in module:  # http sites can happen
-                            next
-                        else:
-                            conda_modules[module] = f"Unexpected formatting on {module}"
-
-                    # pip dependencies, are a nested dict
-                    # this contains single element list, so drill down again
-                    # then iterate through pip dependency lis
-                    elif isinstance(module, dict) and 'pip' in module.keys():
-                        for pip_module in module['pip']:
-                            if "=" in pip_module:
-                                pip_module = pip_module.split("=")[0].strip().lower()
-                                pip_modules[pip_module] = pull_stackoverflow_content(pip_module)
-                                pip_modules[pip_module]["pypi"] = pull_pypi_content(pip_module)
-                            elif "://" in pip_module:  # http sites can happen
-                                next
-                            else:
-                                pip_modules[pip_module] = f"Unexpected formatting on {pip_module}"
-                                
-    all_modules["conda_modules"] = conda_modules
-    all_modules["pip_modules"] = pip_modules
-
-    # write to file
+
+# option added
+# yml_env_modules = get_yml_modules()
+
+# %%
+
+
+def get_all_modules(rescan: bool=False) -> dict:
+    """Scans scripts and environment files in every input directory into one
+    registry, so each package's lookups run once however many sources and
+    files reference it. Results are then fanned back out per source and
+    group, as the scripts and yaml modes would report them.
+
+    It also writes results to a .json file in ouput dir.
+
+    Input: rescan=True to re-parse files the scan index says are unchanged
+    Output: dict of
+        packages: module -> pulled content, plus the files referencing it
+        scripts, yaml: group -> module -> pulled content or note
+        files: filepath -> modules it references
+    """
+    registries = {"scripts": collect_script_modules(input_py_dirs, rescan),
+                  "yaml": collect_yml_modules(input_yml_dirs)}
+
+    # union of sources wanted per module, across every source and group
+    module_sources = merge_sources(registries.values())
+    print(f"registry: {len(module_sources)} unique packages")
+
+    stream = open_output_stream("all_modules")
+    checkpoint = open_checkpoint("all_modules")
+    try:
+        packages = fetch_modules(module_sources, stream and stream.writer_for("packages"), checkpoint)
+        transitive = fetch_transitive(module_sources, stream and stream.writer_for("transitive_modules"), checkpoint) \
+            if transitive_depth else {}
+    finally:
+        if stream:
+            stream.close()
+
+    referenced_by = {}
+    for registry in registries.values():
+        for filepath, modules in registry["files"].items():
+            for module in modules:
+                referenced_by.setdefault(module, []).append(filepath)
+
+    all_modules = {"packages": {module: {**content, "referenced_by": referenced_by.get(module, [])}
+                                for module, content in packages.items()}}
+
+    # fan results back out, each group seeing only the sources it asked for
+    for name, registry in registries.items():
+        all_modules[name] = fan_out(registry, packages)
+
+    all_modules["files"] = {filepath: modules
+                            for registry in registries.values()
+                            for filepath, modules in registry["files"].items()}
+    if transitive_depth:
+        all_modules["transitive_modules"] = transitive
+
+    # the fan out needs every result, so it's written even when streaming
     file = json.dumps(all_modules, indent=4)
-    with open(os.path.join(dir_py, "output", f"yml_env_modules_{right_now}.json"), "w") as outfile:
+    with open(os.path.join(dir_py, "output", f"all_modules_{right_now}.json"), "w") as outfile:
         outfile.write(file)
 
+    if export_tables:
+        export_modules(module_tables(all_modules), os.path.join(dir_py, "output", f"all_modules_{right_now}"))
+
+    checkpoint.close()  # kept only if lookups are left to retry
+
     return all_modules
 
 
 # option added
-# yml_env_modules = get_yml_modules()
+# all_modules = get_all_modules()
 
-# %% 
+# %%
 
-# parse arguments provided in CLI
-opts = parser.parse_args()
 
-# read credentials from creds.txt else ~/.env
-if opts.creds_in_txt:
-    github_user, github_token = token_in_env(False)
-else:
-    github_user, github_token = token_in_env(True)
+def print_run_summary():
+    """Print request stats gathered over the run."""
+    print("run summary:")
+    print(f"    url memo: {run_memo.hits} hits, {run_memo.misses} misses")
+
+    limiters = list(rate_limiters.items()) + [(limiter.name, limiter) for limiter in github_credentials.limiters.values()]
+    for name, limiter in limiters:
+        if limiter.remaining is None:
+            print(f"    {name} quota: not used")
+        else:
+            reset = datetime.fromtimestamp(limiter.reset_at).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"    {name} quota: {limiter.remaining}/{limiter.limit} remaining, resets {reset}")
+
+
+# %%
 
-# generate repo health output from either scripts/modules or yml/yaml
-if opts.source == "scripts":
-    get_script_imports(dir_py)
-elif opts.source == "yml" or opts.source == "yaml":
-    get_yml_modules()
+if __name__ == "__main__":
+    # parse arguments provided in CLI
+    opts = parser.parse_args()
+
+    input_py_dirs = opts.input_py
+    input_yml_dirs = opts.input_yml
+    github_backend = opts.github_api
+    stackoverflow_lookup = opts.stackoverflow_lookup
+    max_workers = opts.workers
+    max_per_host = opts.per_host
+    http_pool_size = opts.pool_size
+    http_timeout = opts.timeout
+    max_rate_wait = opts.max_rate_wait
+    parse_processes = opts.parse_processes
+    target_python = opts.target_python
+    output_format = opts.output
+    resume_scans = opts.resume
+    import_names_files += opts.import_names
+    fetch_unresolved = not opts.skip_unresolved
+    scan_prefix = opts.prefix
+    export_tables = opts.export
+    transitive_depth = opts.transitive_depth
+
+    if opts.fold:
+        fold_ndjson(opts.fold)
+        sys.exit()
+
+    if opts.export_from:
+        export_file(opts.export_from)
+        sys.exit()
+
+    if not opts.no_cache:
+        response_cache = ResponseCache(opts.cache_dir, opts.max_cache_mb)
+        scan_index = ScanIndex(opts.cache_dir)
+        inventory_dir = opts.cache_dir
+
+    if opts.conda_channel_data:
+        conda_index = CondaIndex(opts.cache_dir, opts.conda_channel_data)
+
+    # read github tokens once, from environment, ~/.env and optionally creds.txt
+    github_credentials.load(bool(opts.creds_in_txt))
+
+    # generate repo health output from scripts/modules, yml/yaml, or both
+    if opts.source == "scripts":
+        get_script_imports(dir_py, opts.rescan)
+    elif opts.source == "yml" or opts.source == "yaml":
+        get_yml_modules()
+    elif opts.source == "all":
+        get_all_modules(opts.rescan)
+
+    if response_cache is not None:
+        response_cache.close()
+
+    print_run_summary()